@@ -1,10 +1,26 @@
 import os
 import json
+import threading
+import time
+from collections import namedtuple
 from datetime import datetime, date, timedelta
-from flask import Flask, render_template, request, redirect, url_for, flash, send_from_directory, send_file, session
+from flask import Flask, abort, Response, g, jsonify, render_template, request, redirect, url_for, flash, send_from_directory, send_file, session, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
+from jinja2 import FileSystemBytecodeCache
 from werkzeug.utils import secure_filename
+from werkzeug.security import safe_join
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.hybrid import hybrid_property
 from dotenv import load_dotenv
+from blob_store import BlobTooLarge, make_backends, spool_stream
+from zipstream import stream_zip
+from cache import LRUCache
+from compress import init_compression
+from fanout import ReadFanout
+from fragment_cache import init_fragment_cache
+from schema_migrations import Migration, current_version, run_migrations
+from prefix_index import PrefixIndex
+from search_text import build_search_text, normalize_query, normalize_text, canonical_phone, reversed_phone, phone_query, phone_prefix, digits_prefix_bound
 
 BASE_DIR = os.path.abspath(os.path.dirname(__file__))
 # Load environment variables from a local .env if present (useful for local dev)
@@ -46,12 +62,41 @@ if database_url.startswith('postgres://'):
 app.config['SQLALCHEMY_DATABASE_URI'] = database_url
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+# مكان تخزين محتوى الملفات الجديدة: db (داخل Postgres) أو local (على القرص داخل UPLOAD_FOLDER)
+app.config['BLOB_BACKEND'] = os.getenv('BLOB_BACKEND', 'db')
+# الحد الأقصى لحجم الملف المرفوع (ميجابايت) - الطلب الأكبر يُرفض قبل قراءة محتواه
+app.config['MAX_CONTENT_LENGTH'] = int(os.getenv('MAX_UPLOAD_MB', '25')) * 1024 * 1024
+# مدة احتفاظ المتصفح بالملفات المعروضة (ثانية) - روابط العرض تتغير مع تغير محتوى الملف
+app.config['DOCUMENT_CACHE_SECONDS'] = int(os.getenv('DOCUMENT_CACHE_SECONDS', '86400'))
+# قراءة الملفات القديمة مباشرة من UPLOAD_FOLDER - تُعطّل (0) بعد تشغيل migrate_uploads.py
+app.config['LEGACY_DISK_FALLBACK'] = os.getenv('LEGACY_DISK_FALLBACK', '1') == '1'
+# عدد الصفوف في كل صفحة من القوائم الطويلة (يمكن تغييره بـ ?per_page= حتى MAX_PAGE_SIZE)
+app.config['PAGE_SIZE'] = int(os.getenv('PAGE_SIZE', '50'))
+app.config['MAX_PAGE_SIZE'] = int(os.getenv('MAX_PAGE_SIZE', '200'))
 db = SQLAlchemy(app)
+# القوالب المترجمة (bytecode) على القرص - مشتركة بين الـ workers، وتُعاد ترجمة القالب تلقائياً إذا تغير محتواه
+JINJA_CACHE_DIR = os.getenv('JINJA_CACHE_DIR') or os.path.join(UPLOAD_FOLDER, 'tmp', 'jinja')
+try:
+    os.makedirs(JINJA_CACHE_DIR, exist_ok=True)
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(JINJA_CACHE_DIR)
+except OSError as e:
+    print(f"⚠️ تعذر إنشاء مجلد كاش القوالب، سيتم ترجمة القوالب في الذاكرة فقط: {e}")
+# ترجمة كل القوالب عند تشغيل الـ worker قبل أول طلب (0 لتعطيلها)
+app.config['TEMPLATE_WARMUP'] = os.getenv('TEMPLATE_WARMUP', '1') == '1'
+# عدد استعلامات القراءة التي تُنفذ بالتوازي داخل الطلب الواحد (كل واحد باتصال من الـ pool)
+read_fanout = ReadFanout(app, db, max_workers=int(os.getenv('READ_FANOUT_WORKERS', '4')))
+# ضغط gzip لصفحات HTML وJSON الأكبر من COMPRESS_MIN_SIZE بايت + ETag يرجع 304 للصفحة التي لم تتغير
+init_compression(app, min_size=int(os.getenv('COMPRESS_MIN_SIZE', '1024')),
+                 level=int(os.getenv('COMPRESS_LEVEL', '6')),
+                 enabled=os.getenv('COMPRESS', '1') == '1')
 
 # ------------------ Models ------------------
 
 # نموذج المستخدمين
 class User(db.Model):
+    __table_args__ = (
+        db.Index('ix_user_created_at_id', 'created_at', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     employee_name = db.Column(db.String(120), nullable=False)  # اسم الموظف
     username = db.Column(db.String(80), unique=True, nullable=False)
@@ -66,6 +111,11 @@ class User(db.Model):
     def is_admin(self):
         return self.role == 'admin'
 class Client(db.Model):
+    # فهارس ترتيب القوائم بالأحدث (keyset_paginate) ومع فلتر الحالة
+    __table_args__ = (
+        db.Index('ix_client_created_at_id', 'created_at', 'id'),
+        db.Index('ix_client_status_created_at_id', 'status', 'created_at', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(120), nullable=False)
     phone = db.Column(db.String(50), nullable=False)
@@ -74,26 +124,39 @@ class Client(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     status = db.Column(db.String(30), default="جاري")  # جاري/مكتمل/مرفوض/رفع مرة أخرى/لغا المعاملة
     rejection_reason = db.Column(db.String(50), nullable=True)  # رقم المرة عند الرفع مرة أخرى
+    # مجموع الدفعات المسددة - يُحدّث مع كل تعديل على الدفعات (refresh_paid_total) حتى لا تُحمّل الدفعات لحساب الرصيد
+    paid_total = db.Column(db.Integer, nullable=False, default=0, server_default='0')
 
     payments = db.relationship('Payment', backref='client', lazy=True, cascade="all, delete-orphan")
     documents = db.relationship('Document', backref='client', lazy=True, cascade="all, delete-orphan")
     followups = db.relationship('Followup', backref='client', lazy=True, cascade="all, delete-orphan")
+    attention = db.relationship('ClientAttention', uselist=False, lazy=True, cascade="all, delete-orphan")
 
-    @property
+    # paid_sum و remaining تعمل على العميل وفي الاستعلامات (order_by / filter) بدون تحميل الدفعات
+    @hybrid_property
     def paid_sum(self):
-        return sum(p.amount for p in self.payments if p.is_paid)
+        return self.paid_total or 0
 
-    @property
+    @paid_sum.expression
+    def paid_sum(cls):
+        return cls.paid_total
+
+    @hybrid_property
     def remaining(self):
         return max(self.total_amount - self.paid_sum, 0)
 
+    @remaining.expression
+    def remaining(cls):
+        balance = cls.total_amount - cls.paid_total
+        return db.case((balance > 0, balance), else_=0)
+
 class Payment(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    client_id = db.Column(db.Integer, db.ForeignKey('client.id'), nullable=False)
+    client_id = db.Column(db.Integer, db.ForeignKey('client.id'), nullable=False, index=True)
     number = db.Column(db.Integer, nullable=False)  # رقم الدفعة
     amount = db.Column(db.Integer, nullable=False)
     paid_date = db.Column(db.Date, nullable=True)        # تاريخ الدفع الفعلي (لو اتدفعت)
-    next_due_date = db.Column(db.Date, nullable=True)    # ميعاد الدفعة القادمة
+    next_due_date = db.Column(db.Date, nullable=True, index=True)    # ميعاد الدفعة القادمة
     is_paid = db.Column(db.Boolean, default=True)        # دفعة مُسددة؟ (True) ولا مجرد جدولة قادمة؟ (False)
     payment_type = db.Column(db.String(50), nullable=True) # نوع الدفعة (مثل "دفعة" أو "رسوم سفارة")
 
@@ -111,24 +174,42 @@ class Payment(db.Model):
         return ("غير محدد", "secondary")
 
 class Document(db.Model):
+    __table_args__ = (
+        # وثيقة واحدة بكل اسم للعميل - يعتمد عليه update_existing_clients_documents
+        db.Index('ux_document_client_id_name', 'client_id', 'name', unique=True),
+    )
     id = db.Column(db.Integer, primary_key=True)
-    client_id = db.Column(db.Integer, db.ForeignKey('client.id'), nullable=False)
+    client_id = db.Column(db.Integer, db.ForeignKey('client.id'), nullable=False, index=True)
     name = db.Column(db.String(120), nullable=False)
     required = db.Column(db.Boolean, default=True)
     status = db.Column(db.String(20), default="ناقصة")  # ناقصة/مكتملة
-    file_path = db.Column(db.String(300), nullable=True)
+    file_path = db.Column(db.String(300), nullable=True, index=True)
     uploaded_at = db.Column(db.DateTime, nullable=True)
-    # تخزين الملف داخل قاعدة البيانات (Postgres)
-    file_bytes = db.Column(db.LargeBinary, nullable=True)
+    # بصمة محتوى الملف في جدول blob (الملفات الجديدة)
+    blob_hash = db.Column(db.String(64), db.ForeignKey('blob.hash'), nullable=True, index=True)
+    # تخزين الملف داخل قاعدة البيانات (Postgres) - للوثائق القديمة قبل مخزن البصمات
+    # deferred: محتوى الملف لا يُجلب مع الوثيقة، فقط عند طلبه صراحةً في مسارات العرض والتحميل
+    file_bytes = db.deferred(db.Column(db.LargeBinary, nullable=True))
     file_name = db.Column(db.String(300), nullable=True)
     file_mime = db.Column(db.String(100), nullable=True)
     file_size = db.Column(db.Integer, nullable=True)
-    
+    # أعلام وجود الملف تُحسب داخل قاعدة البيانات بدون نقل محتوى الملف
+    # (محتوى فارغ أو مسار فارغ ليس ملفاً، كما كان التحقق بـ doc.file_bytes / selectattr('file_path'))
+    has_db_file = db.column_property(db.or_(blob_hash.isnot(None), db.func.length(file_bytes.columns[0]) > 0))
+    has_file = db.column_property(db.or_(
+        blob_hash.isnot(None), db.func.length(file_bytes.columns[0]) > 0, db.func.length(file_path) > 0
+    ))
+
     # حقول المواعيد الجديدة
     deadline_start = db.Column(db.Date, nullable=True)  # بداية المدة
     deadline_end = db.Column(db.Date, nullable=True)    # نهاية المدة
     deadline_warning_days = db.Column(db.Integer, default=7)  # عدد أيام التنبيه المبكر
     
+    @property
+    def file_version(self):
+        """جزء من بصمة المحتوى يُضاف لروابط العرض حتى يتغير الرابط عند استبدال الملف"""
+        return self.blob_hash[:12] if self.blob_hash else None
+    
     def get_deadline_status(self):
         """يرجع حالة الموعد النهائي للورقة"""
         if not self.deadline_end:
@@ -165,6 +246,30 @@ class Document(db.Model):
             elapsed_days = (today - self.deadline_start).days
             return min(100, max(0, (elapsed_days / total_days) * 100))
 
+# ملخص ما يحتاج متابعة لكل عميل - يُحدّث في نفس معاملة أي تعديل على الدفعات أو الوثائق
+class ClientAttention(db.Model):
+    __tablename__ = 'client_attention'
+    client_id = db.Column(db.Integer, db.ForeignKey('client.id', ondelete='CASCADE'), primary_key=True)
+    missing_required_docs = db.Column(db.Integer, nullable=False, default=0, index=True)
+    overdue_payments = db.Column(db.Integer, nullable=False, default=0, index=True)
+    # أقرب دفعة غير مسددة لم يحن موعدها بعد - لو أصبح تاريخها قبل اليوم فالصف يحتاج إعادة حساب
+    next_due_date = db.Column(db.Date, nullable=True, index=True)
+    oldest_overdue_date = db.Column(db.Date, nullable=True)
+
+# محتوى الملفات المرفوعة - صف واحد لكل محتوى مهما تكرر رفعه
+class Blob(db.Model):
+    hash = db.Column(db.String(64), primary_key=True)  # SHA-256
+    size = db.Column(db.Integer, nullable=False)
+    backend = db.Column(db.String(20), nullable=False)  # db/local
+    ref_count = db.Column(db.Integer, nullable=False, default=0)  # عدد الوثائق التي تشير لهذا المحتوى
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+# أجزاء محتوى الملف عند التخزين داخل قاعدة البيانات (backend = db)
+class BlobChunk(db.Model):
+    blob_hash = db.Column(db.String(64), primary_key=True)
+    seq = db.Column(db.Integer, primary_key=True)  # ترتيب الجزء داخل الملف
+    data = db.Column(db.LargeBinary, nullable=False)
+
 class Followup(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     client_id = db.Column(db.Integer, db.ForeignKey('client.id'), nullable=False)
@@ -173,6 +278,9 @@ class Followup(db.Model):
 
 # نموذج إدارة الملفات - العملاء المستاءين
 class DisappointedClient(db.Model):
+    __table_args__ = (
+        db.Index('ix_disappointed_client_created_at_id', 'created_at', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     client_name = db.Column(db.String(120), nullable=False)
     phone = db.Column(db.String(50), nullable=False)
@@ -188,8 +296,15 @@ class DisappointedClient(db.Model):
     second_submission_date = db.Column(db.Date, nullable=True)  # تاريخ التقديم للمرة الثانية
     second_rejection_date = db.Column(db.Date, nullable=True)  # تاريخ الرفض للمرة الثانية
 
+    # passive_deletes='all': حذف السجل لا يعدّل المتابعات المرتبطة به (نفس السلوك قبل العلاقات)
+    followups = db.relationship('ClientFollowup', back_populates='client', lazy=True, passive_deletes='all',
+                                order_by='ClientFollowup.created_at.desc()')
+
 # نموذج متابعة العميل المستاء
 class ClientFollowup(db.Model):
+    __table_args__ = (
+        db.Index('ix_client_followup_created_at_id', 'created_at', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     client_id = db.Column(db.Integer, db.ForeignKey('disappointed_client.id'), nullable=True)  # ربط مع العميل المستاء
     form_received_date = db.Column(db.Date, nullable=False)
@@ -201,8 +316,14 @@ class ClientFollowup(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     created_by = db.Column(db.String(120), nullable=True)
 
+    client = db.relationship('DisappointedClient', back_populates='followups')
+    legal_cases = db.relationship('LegalCase', back_populates='followup', lazy=True, passive_deletes='all')
+
 # نموذج الشؤون القانونية
 class LegalCase(db.Model):
+    __table_args__ = (
+        db.Index('ix_legal_case_created_at_id', 'created_at', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     followup_id = db.Column(db.Integer, db.ForeignKey('client_followup.id'), nullable=True)  # ربط مع المتابعة
     form_received_date = db.Column(db.Date, nullable=False)
@@ -214,6 +335,8 @@ class LegalCase(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     created_by = db.Column(db.String(120), nullable=True)
 
+    followup = db.relationship('ClientFollowup', back_populates='legal_cases')
+
 # نموذج العملاء المكتملين
 class CompletedClient(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -254,6 +377,9 @@ class PendingLegalClient(db.Model):
 
 # نموذج العملاء المكتملين بالكامل (جميع المراحل)
 class FullyCompletedClient(db.Model):
+    __table_args__ = (
+        db.Index('ix_fully_completed_client_created_at_id', 'created_at', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     client_name = db.Column(db.String(120), nullable=False)
     client_phone = db.Column(db.String(50), nullable=False)
@@ -290,8 +416,13 @@ class FullyCompletedClient(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     created_by = db.Column(db.String(120), nullable=True)
 
+    refund_payments = db.relationship('RefundPayment', back_populates='client', lazy=True, passive_deletes='all')
+
 # نموذج دفعات الاسترداد
 class RefundPayment(db.Model):
+    __table_args__ = (
+        db.Index('ix_refund_payment_created_at_id', 'created_at', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     client_id = db.Column(db.Integer, db.ForeignKey('fully_completed_client.id'), nullable=True)  # ربط مع العميل المكتمل
     client_name = db.Column(db.String(120), nullable=False)
@@ -304,7 +435,394 @@ class RefundPayment(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     created_by = db.Column(db.String(120), nullable=True)
 
+    client = db.relationship('FullyCompletedClient', back_populates='refund_payments')
 
+# فهرس البحث الموحد - صف لكل عقد/عميل في مراحل الشكاوى/دفعة استرداد (الاسم والهاتف)
+class SearchEntry(db.Model):
+    __tablename__ = 'search_entry'
+    __table_args__ = (
+        db.UniqueConstraint('entity', 'entity_id', name='uq_search_entry_entity'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    entity = db.Column(db.String(30), nullable=False)
+    entity_id = db.Column(db.Integer, nullable=False)
+    name = db.Column(db.String(200), nullable=True)
+    phone = db.Column(db.String(50), nullable=True)
+    search_text = db.Column(db.Text, nullable=False, default='')
+    # الهاتف بالأرقام فقط بدون كود الدولة والصفر، ومعكوساً للبحث بآخر الأرقام
+    phone_digits = db.Column(db.String(20), nullable=True, index=True)
+    phone_reversed = db.Column(db.String(20), nullable=True, index=True)
+
+# سجل تغييرات فهرس البحث (إضافة/تعديل/حذف) - كل worker يقرأ الجديد منه لتحديث فهرس الاقتراحات
+class SearchChange(db.Model):
+    __tablename__ = 'search_change'
+    id = db.Column(db.Integer, primary_key=True)
+    entity = db.Column(db.String(30), nullable=False)
+    entity_id = db.Column(db.Integer, nullable=False)
+
+# رقم إصدار لكل جدول يزيد مع كل تعديل فيه - مفتاح كاش أجزاء القوالب ({% cache ... on 'table' %})
+class TableVersion(db.Model):
+    __tablename__ = 'table_version'
+    name = db.Column(db.String(64), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+
+BLOB_BACKENDS = make_backends(UPLOAD_FOLDER, db.session, lambda: db.engine, BlobChunk.__table__)
+
+# الجداول المفهرسة في search_entry: الاسم المختصر -> (النموذج، عمود الاسم، عمود الهاتف)
+SEARCHABLE = {
+    'client': (Client, 'name', 'phone'),
+    'disappointed': (DisappointedClient, 'client_name', 'phone'),
+    'pending_legal': (PendingLegalClient, 'client_name', 'client_phone'),
+    'completed': (CompletedClient, 'client_name', 'client_phone'),
+    'fully_completed': (FullyCompletedClient, 'client_name', 'client_phone'),
+    'refund': (RefundPayment, 'client_name', 'client_phone'),
+}
+SEARCH_ENTITY_BY_MODEL = {model: entity for entity, (model, _, _) in SEARCHABLE.items()}
+
+def search_entry_row(entity, entity_id, name, phone):
+    return {'entity': entity, 'entity_id': entity_id, 'name': name, 'phone': phone,
+            'search_text': build_search_text(name, phone),
+            'phone_digits': canonical_phone(phone), 'phone_reversed': reversed_phone(phone)}
+
+def search_entry_values(entity, obj):
+    _, name_attr, phone_attr = SEARCHABLE[entity]
+    return search_entry_row(entity, obj.id, getattr(obj, name_attr), getattr(obj, phone_attr))
+
+@db.event.listens_for(db.session, 'after_flush')
+def sync_search_index(session, flush_context):
+    """يحدّث search_entry في نفس المعاملة لكل صف مفهرس أُضيف أو تغير اسمه/هاتفه أو حُذف"""
+    changed = {}
+    for obj in list(session.new) + list(session.dirty):
+        entity = SEARCH_ENTITY_BY_MODEL.get(type(obj))
+        if entity is None:
+            continue
+        _, name_attr, phone_attr = SEARCHABLE[entity]
+        state = db.inspect(obj)
+        if obj in session.new or any(state.attrs[a].history.has_changes() for a in (name_attr, phone_attr)):
+            changed[(entity, obj.id)] = obj
+    for obj in session.deleted:
+        entity = SEARCH_ENTITY_BY_MODEL.get(type(obj))
+        if entity is not None:
+            changed[(entity, obj.id)] = None
+    if not changed:
+        return
+    table = SearchEntry.__table__
+    conn = session.connection()
+    for entity in {entity for entity, _ in changed}:
+        ids = [entity_id for e, entity_id in changed if e == entity]
+        conn.execute(table.delete().where(table.c.entity == entity, table.c.entity_id.in_(ids)))
+    rows = [search_entry_values(entity, obj) for (entity, _), obj in changed.items() if obj is not None]
+    if rows:
+        conn.execute(table.insert(), rows)
+    conn.execute(SearchChange.__table__.insert(),
+                 [{'entity': entity, 'entity_id': entity_id} for entity, entity_id in changed])
+
+def rebuild_search_index(batch_size: int = 1000):
+    """يعيد بناء search_entry بالكامل من الجداول المفهرسة (بدون commit)"""
+    table = SearchEntry.__table__
+    db.session.execute(table.delete())
+    # الفهرس كله جديد فلا حاجة للسجل القديم - الـ workers يعيدون التحميل عند ملاحظة ذلك
+    db.session.execute(SearchChange.__table__.delete())
+    for entity, (model, name_attr, phone_attr) in SEARCHABLE.items():
+        rows = []
+        for row_id, name, phone in db.session.query(
+            model.id, getattr(model, name_attr), getattr(model, phone_attr)
+        ).yield_per(batch_size):
+            rows.append(search_entry_row(entity, row_id, name, phone))
+            if len(rows) >= batch_size:
+                db.session.execute(table.insert(), rows)
+                rows = []
+        if rows:
+            db.session.execute(table.insert(), rows)
+
+def search_index_is_stale(sample: int = 100) -> bool:
+    """الفهرس فارغ أو مبني بتجهيز نص مختلف عن الحالي (فحص عينة من الصفوف)"""
+    entries = SearchEntry.query.order_by(SearchEntry.id).limit(sample).all()
+    return not entries or any(
+        (e.search_text, e.phone_digits, e.phone_reversed) != tuple(
+            search_entry_row(e.entity, e.entity_id, e.name, e.phone)[k]
+            for k in ('search_text', 'phone_digits', 'phone_reversed'))
+        for e in entries
+    )
+
+def setup_search_index() -> str:
+    """ينشئ فهرس النص المناسب لقاعدة البيانات ويرجع نوعه: trgm (Postgres) أو fts5 (SQLite) أو like"""
+    from sqlalchemy import text
+    try:
+        if db.engine.name == 'postgresql':
+            with db.engine.begin() as conn:
+                conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+                conn.execute(text(
+                    "CREATE INDEX IF NOT EXISTS ix_search_entry_trgm ON search_entry USING gin (search_text gin_trgm_ops)"
+                ))
+            return 'trgm'
+        if db.engine.name == 'sqlite':
+            with db.engine.begin() as conn:
+                # جدول FTS5 بمحتوى search_entry - الـ triggers تبقيه متزامناً مع كل إضافة/حذف/تعديل
+                conn.execute(text(
+                    "CREATE VIRTUAL TABLE IF NOT EXISTS search_entry_fts USING fts5("
+                    "search_text, content='search_entry', content_rowid='id', tokenize='trigram')"
+                ))
+                conn.execute(text(
+                    "CREATE TRIGGER IF NOT EXISTS search_entry_ai AFTER INSERT ON search_entry BEGIN "
+                    "INSERT INTO search_entry_fts(rowid, search_text) VALUES (new.id, new.search_text); END"
+                ))
+                conn.execute(text(
+                    "CREATE TRIGGER IF NOT EXISTS search_entry_ad AFTER DELETE ON search_entry BEGIN "
+                    "INSERT INTO search_entry_fts(search_entry_fts, rowid, search_text) "
+                    "VALUES ('delete', old.id, old.search_text); END"
+                ))
+                conn.execute(text(
+                    "CREATE TRIGGER IF NOT EXISTS search_entry_au AFTER UPDATE ON search_entry BEGIN "
+                    "INSERT INTO search_entry_fts(search_entry_fts, rowid, search_text) "
+                    "VALUES ('delete', old.id, old.search_text); "
+                    "INSERT INTO search_entry_fts(rowid, search_text) VALUES (new.id, new.search_text); END"
+                ))
+            return 'fts5'
+    except Exception as e:
+        print(f"⚠️ تعذر إنشاء فهرس البحث النصي، سيتم البحث بدون فهرس: {e}")
+    return 'like'
+
+def search_backend() -> str:
+    """نوع فهرس النص الموجود في قاعدة البيانات (يُقرأ مرة واحدة لكل worker)"""
+    backend = app.config.get('SEARCH_BACKEND')
+    if backend is None:
+        from sqlalchemy import text
+        if db.engine.name == 'postgresql':
+            found = db.session.execute(text("SELECT 1 FROM pg_indexes WHERE indexname = 'ix_search_entry_trgm'")).first()
+            backend = 'trgm' if found else 'like'
+        elif db.engine.name == 'sqlite':
+            found = db.session.execute(text("SELECT 1 FROM sqlite_master WHERE name = 'search_entry_fts'")).first()
+            backend = 'fts5' if found else 'like'
+        else:
+            backend = 'like'
+        app.config['SEARCH_BACKEND'] = backend
+    return backend
+
+# أقل طول لجزء البحث الذي يستخدم فهرس الـ trigram
+SEARCH_MIN_INDEXED_LENGTH = 3
+
+def digits_prefix_match(column, prefix):
+    """النصوص التي تبدأ بـ prefix كمدى على الفهرس"""
+    bound = digits_prefix_bound(prefix)
+    condition = column >= prefix
+    return db.and_(condition, column < bound) if bound else condition
+
+def phone_match(kind, digits):
+    """مطابقة الهاتف من الفهرس: رقم كامل بالمساواة، أو جزء من الرقم كنهايته (الرقم المعكوس) أو بدايته"""
+    if kind == 'full':
+        return SearchEntry.phone_digits == digits
+    suffix, prefix = digits
+    conditions = [digits_prefix_match(SearchEntry.phone_reversed, suffix)]
+    if prefix:
+        conditions.append(digits_prefix_match(SearchEntry.phone_digits, prefix))
+    return db.or_(*conditions)
+
+def search_match(queries):
+    """شرط مطابقة أي من الاستعلامات (رقم هاتف أو بحث جزئي داخل النص) وترتيب الأقرب أولاً"""
+    backend = search_backend()
+    text_col = SearchEntry.search_text
+    phones = [p for p in (phone_query(q) for q in queries) if p]
+    terms = [t for t in (normalize_query(q) for q in queries if not phone_query(q)) if t]
+    phone_conditions = [phone_match(kind, digits) for kind, digits in phones]
+    conditions = list(phone_conditions)
+    order = [db.case((db.or_(*phone_conditions), 0), else_=1)] if phone_conditions and terms else []
+    rank = None
+    indexed = [t for t in terms if len(t) >= SEARCH_MIN_INDEXED_LENGTH]
+    if backend == 'fts5' and indexed:
+        match = ' OR '.join('"%s"' % t.replace('"', '""') for t in indexed)
+        fts = db.text(
+            "SELECT rowid, bm25(search_entry_fts) AS rank FROM search_entry_fts WHERE search_entry_fts MATCH :match"
+        ).bindparams(match=match).columns(rowid=db.Integer, rank=db.Float).subquery()
+        conditions.append(SearchEntry.id.in_(db.select(fts.c.rowid)))
+        rank = db.select(fts.c.rank).where(fts.c.rowid == SearchEntry.id).scalar_subquery()
+        terms = [t for t in terms if len(t) < SEARCH_MIN_INDEXED_LENGTH]
+    conditions.extend(text_col.contains(t, autoescape=True) for t in terms)
+    if backend == 'trgm' and terms:
+        rank = -db.func.greatest(*[db.func.similarity(text_col, t) for t in terms])
+    if rank is not None:
+        order.append(rank)
+    return db.or_(*conditions), order
+
+def search_index(*queries, entities=None, limit: int = 200):
+    """بحث واحد مرتب بالأقرب في كل الجداول المفهرسة (أي من النصوص المعطاة)، يرجع صفوف SearchEntry"""
+    queries = [q for q in queries if normalize_query(q)]
+    if not queries:
+        return []
+    condition, order = search_match(queries)
+    query = SearchEntry.query.filter(condition)
+    if entities:
+        query = query.filter(SearchEntry.entity.in_(entities))
+    return query.order_by(*order, SearchEntry.id.desc()).limit(limit).all()
+
+def search_entity_ids(query_text, entity):
+    """استعلام فرعي بمعرفات صفوف جدول واحد المطابقة للبحث - للاستخدام داخل filter(Model.id.in_(...))"""
+    condition, _ = search_match([query_text])
+    return db.select(SearchEntry.entity_id).where(SearchEntry.entity == entity, condition)
+
+# جداول لا تظهر في القوالب - تعديلها لا يغير أرقام الإصدار
+UNVERSIONED_TABLES = {'table_version', 'search_entry', 'search_change', 'blob', 'blob_chunk'}
+
+@db.event.listens_for(db.session, 'after_flush')
+def collect_changed_tables(session, flush_context):
+    """يجمع الجداول التي أُضيف فيها أو عُدل أو حُذف صف - أرقام إصدارها تزيد مرة واحدة بعد الـ commit"""
+    changed = list(session.new) + list(session.deleted) + [o for o in session.dirty if session.is_modified(o)]
+    bump_versions(session, {obj.__table__.name for obj in changed})
+
+def bump_versions(session, tables):
+    """يسجل الجداول المعدلة في هذه المعاملة - يُستدعى مباشرة بعد تعديلات Core (insert/update) التي لا يراها after_flush"""
+    tables = set(tables) - UNVERSIONED_TABLES
+    if tables:
+        session.info.setdefault('changed_tables', set()).update(tables)
+
+@db.event.listens_for(db.session, 'after_commit')
+def bump_table_versions(session):
+    """UPDATE واحد لأرقام إصدار الجداول المعدلة بعد نجاح الـ commit (على اتصال منفصل - الجلسة لا تنفذ SQL هنا)"""
+    tables = session.info.pop('changed_tables', None)
+    if tables:
+        table = TableVersion.__table__
+        with db.engine.begin() as conn:
+            conn.execute(table.update().where(table.c.name.in_(sorted(tables))).values(version=table.c.version + 1))
+
+@db.event.listens_for(db.session, 'after_rollback')
+def discard_changed_tables(session):
+    session.info.pop('changed_tables', None)
+
+def ensure_table_versions():
+    """صف إصدار لكل جدول (يُنفذ عند التشغيل)"""
+    existing = {name for (name,) in db.session.query(TableVersion.name)}
+    missing = set(db.metadata.tables) - UNVERSIONED_TABLES - existing
+    if missing:
+        db.session.add_all(TableVersion(name=name, version=0) for name in sorted(missing))
+        db.session.commit()
+
+def snapshot_table_versions():
+    """يقرأ أرقام إصدار كل الجداول في بداية الصفحة قبل استعلامات بياناتها،
+    فلا يُحفظ جزء قالب تحت إصدار أحدث من البيانات التي عرضها"""
+    g.table_versions = dict(db.session.query(TableVersion.name, TableVersion.version))
+
+def table_versions(tables):
+    """أرقام إصدار الجداول المطلوبة - من snapshot_table_versions إن سبقت، وإلا استعلام واحد على الأكثر لكل طلب"""
+    if 'table_versions' not in g:
+        snapshot_table_versions()
+    return tuple(g.table_versions.get(t, 0) for t in tables)
+
+init_fragment_cache(app, table_versions,
+                    backend=LRUCache(maxsize=int(os.getenv('FRAGMENT_CACHE_SIZE', '256')),
+                                     ttl=int(os.getenv('FRAGMENT_CACHE_SECONDS', '300'))),
+                    enabled=os.getenv('FRAGMENT_CACHE', '1') == '1')
+
+# -------- الاقتراحات أثناء الكتابة (فهرس بادئات في ذاكرة كل worker) --------
+SUGGEST_REFRESH_SECONDS = float(os.getenv('SUGGEST_REFRESH_SECONDS', '2'))
+SUGGEST_FULL_REFRESH_SECONDS = float(os.getenv('SUGGEST_FULL_REFRESH_SECONDS', '3600'))
+SUGGEST_MAX_NODES = int(os.getenv('SUGGEST_MAX_NODES', '200000'))
+SUGGEST_LIMIT = 8
+# نتائج السجل القديمة التي يُعاد قراءتها في كل تحديث (معاملات انتهت بعد معاملات أحدث منها)
+SUGGEST_CHANGE_OVERLAP = 50
+
+class SuggestState:
+    index = None
+    last_change = 0
+    # رقم آخر تغيير عند آخر بناء كامل (last_change يتقدم مع كل تحديث)
+    built_change = 0
+    checked_at = 0.0
+    built_at = 0.0
+    lock = threading.Lock()
+
+def suggest_tokens(name, phone):
+    """كلمات الاسم المجهزة + الهاتف الموحد"""
+    tokens = normalize_text(name).split()
+    canonical = canonical_phone(phone)
+    return tokens + [canonical] if canonical else tokens
+
+def suggest_add(index, entity, entity_id, name, phone):
+    index.add((entity, entity_id), suggest_tokens(name, phone),
+              {'entity': entity, 'id': entity_id, 'name': name, 'phone': phone})
+
+def prune_search_changes(before_id: int):
+    """
+    يحذف سجل التغييرات حتى رقم آخر تغيير عند البناء الكامل السابق لهذا الـ worker (قبل
+    SUGGEST_FULL_REFRESH_SECONDS على الأقل): كل worker بنى فهرسه بعد ذلك يقرأ من رقم أكبر،
+    ومن بناه قبل ذلك يعيد البناء الكامل قبل أن يقرأ السجل
+    """
+    with db.engine.begin() as conn:
+        conn.execute(SearchChange.__table__.delete().where(
+            SearchChange.id <= before_id - SUGGEST_CHANGE_OVERLAP
+        ))
+
+def build_suggest_index(prune_log: bool = False):
+    """تحميل كامل من search_entry - رقم آخر تغيير يُقرأ أولاً حتى لا يضيع تغيير يحدث أثناء التحميل"""
+    if prune_log and SuggestState.built_change:
+        prune_search_changes(SuggestState.built_change)
+    last_change = db.session.query(db.func.max(SearchChange.id)).scalar() or 0
+    index = PrefixIndex(max_nodes=SUGGEST_MAX_NODES)
+    for entity, entity_id, name, phone in db.session.query(
+        SearchEntry.entity, SearchEntry.entity_id, SearchEntry.name, SearchEntry.phone
+    ).order_by(SearchEntry.id.desc()).yield_per(1000):
+        suggest_add(index, entity, entity_id, name, phone)
+    SuggestState.index, SuggestState.last_change = index, last_change
+    SuggestState.built_change = last_change
+    SuggestState.built_at = time.monotonic()
+
+def refresh_suggest_index():
+    """يطبق التغييرات الجديدة من search_change فقط على فهرس الاقتراحات"""
+    changes = db.session.query(SearchChange.id, SearchChange.entity, SearchChange.entity_id).filter(
+        SearchChange.id > SuggestState.last_change - SUGGEST_CHANGE_OVERLAP
+    ).order_by(SearchChange.id).all()
+    if not changes:
+        if db.session.query(SearchChange.id).first() is None and SuggestState.last_change:
+            build_suggest_index()  # أُعيد بناء فهرس البحث ومُسح السجل
+        return
+    keys = {(entity, entity_id) for _, entity, entity_id in changes}
+    entries = {}
+    for entity in {entity for entity, _ in keys}:
+        ids = [entity_id for e, entity_id in keys if e == entity]
+        for entry in SearchEntry.query.filter(SearchEntry.entity == entity, SearchEntry.entity_id.in_(ids)):
+            entries[(entry.entity, entry.entity_id)] = entry
+    for key in keys:
+        entry = entries.get(key)
+        if entry is None:
+            SuggestState.index.remove(key)
+        else:
+            suggest_add(SuggestState.index, entry.entity, entry.entity_id, entry.name, entry.phone)
+    SuggestState.last_change = max(SuggestState.last_change, changes[-1][0])
+
+def get_suggest_index() -> PrefixIndex:
+    """الفهرس يُبنى عند أول طلب، ويُحدّث من السجل مرة كل SUGGEST_REFRESH_SECONDS على الأكثر"""
+    now = time.monotonic()
+    if SuggestState.index is not None and now - SuggestState.checked_at < SUGGEST_REFRESH_SECONDS:
+        return SuggestState.index
+    with SuggestState.lock:
+        if SuggestState.index is None:
+            build_suggest_index()
+        elif now - SuggestState.built_at > SUGGEST_FULL_REFRESH_SECONDS:
+            build_suggest_index(prune_log=True)
+        elif now - SuggestState.checked_at >= SUGGEST_REFRESH_SECONDS:
+            refresh_suggest_index()
+        SuggestState.checked_at = now
+    return SuggestState.index
+
+def suggest_url(entity, entity_id, name):
+    """رابط صفحة العميل حسب المرحلة، وصفحة البحث للمراحل التي ليس لها صفحة تفاصيل"""
+    if entity == 'client':
+        return url_for('client_detail', client_id=entity_id)
+    if entity == 'completed':
+        return url_for('completed_client_details', client_id=entity_id)
+    if entity == 'pending_legal':
+        return url_for('pending_legal_client_details', client_id=entity_id)
+    if entity == 'fully_completed':
+        return url_for('fully_completed_client_details', client_id=entity_id)
+    return url_for('search_client', client_name=name)
+
+def load_search_hits(hits, entity, options=()):
+    """يحمل صفوف جدول واحد من نتائج search_index بنفس ترتيبها"""
+    ids = [hit.entity_id for hit in hits if hit.entity == entity]
+    if not ids:
+        return []
+    model = SEARCHABLE[entity][0]
+    objs = {obj.id: obj for obj in model.query.options(*options).filter(model.id.in_(ids))}
+    return [objs[i] for i in ids if i in objs]
 
 # ------------------ Helpers ------------------
 def seed_documents_for_client(client_id: int):
@@ -315,7 +833,339 @@ def seed_documents_for_client(client_id: int):
     for n in DOCS_OPTIONAL:
         docs.append(Document(client_id=client_id, name=n, required=False, status="ناقصة"))
     db.session.add_all(docs)
+    refresh_client_attention([client_id])
+    db.session.commit()
+
+def store_blob(stream, max_size: int = None) -> Blob:
+    """يخزن المحتوى مرة واحدة بالبصمة ويزيد عدد المراجع إن كان موجوداً مسبقاً.
+    المحتوى يُقرأ على أجزاء فلا يُحمّل الملف كاملاً في الذاكرة."""
+    blob_hash, size, tmp_path = spool_stream(stream, os.path.join(UPLOAD_FOLDER, 'tmp'), max_size)
+    return store_spooled_blob(blob_hash, size, tmp_path)
+
+def store_spooled_blob(blob_hash: str, size: int, tmp_path: str, refs: int = 1) -> Blob:
+    """يضيف ملفاً مؤقتاً (ناتج spool_stream) إلى المخزن بعدد المراجع refs"""
+    blob = db.session.get(Blob, blob_hash)
+    if blob is not None:
+        os.remove(tmp_path)
+    else:
+        backend = BLOB_BACKENDS[app.config['BLOB_BACKEND']]
+        blob = Blob(hash=blob_hash, size=size, backend=backend.name, ref_count=refs)
+        try:
+            with db.session.begin_nested():
+                db.session.add(blob)
+                db.session.flush()
+                backend.write_file(blob, tmp_path)
+            return blob
+        except IntegrityError:
+            # رفع متزامن لنفس المحتوى سبقنا في الإضافة
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            blob = db.session.get(Blob, blob_hash)
+    blob.ref_count = Blob.ref_count + refs
+    return blob
+
+def release_blob(blob_hash):
+    """ينقص عدد المراجع، والمحتوى غير المستخدم يحذفه purge_unreferenced_blobs (migrate.py مع كل نشر)"""
+    if not blob_hash:
+        return
+    Blob.query.filter_by(hash=blob_hash).update(
+        {Blob.ref_count: Blob.ref_count - 1}, synchronize_session=False
+    )
+
+def purge_unreferenced_blobs() -> int:
+    """يحذف المحتوى الذي لم تعد أي وثيقة تشير إليه"""
+    orphans = [(b.hash, b.backend) for b in Blob.query.filter(Blob.ref_count <= 0).all()]
+    if not orphans:
+        return 0
+    Blob.query.filter(Blob.ref_count <= 0).delete(synchronize_session=False)
+    db.session.commit()
+    for blob_hash, backend in orphans:
+        # لو أُعيد رفع نفس المحتوى بعد الحذف نترك الملف
+        if db.session.get(Blob, blob_hash) is None:
+            BLOB_BACKENDS[backend].delete(blob_hash)
     db.session.commit()
+    return len(orphans)
+
+def open_document_file(doc: Document):
+    """يرجع (ملف للقراءة، الحجم، ETag) لمحتوى الوثيقة المخزن (مخزن البصمات أو العمود القديم) أو None"""
+    if doc.blob_hash:
+        blob = Blob.query.get(doc.blob_hash)
+        if blob is not None:
+            return BLOB_BACKENDS[blob.backend].open(blob), blob.size, blob.hash
+    if doc.file_bytes:
+        import io
+        import hashlib
+        return io.BytesIO(doc.file_bytes), len(doc.file_bytes), hashlib.sha256(doc.file_bytes).hexdigest()
+    return None
+
+def open_stored_document(doc_id: int):
+    """ملف الوثيقة للقراءة، أو None إذا حُذفت الوثيقة أو محتواها بعد عرض القائمة"""
+    doc = db.session.get(Document, doc_id)
+    opened = open_document_file(doc) if doc is not None else None
+    return opened[0] if opened else None
+
+def private_cache(response):
+    """تخزين مؤقت في متصفح المستخدم فقط (الملفات تخص العملاء)"""
+    response.cache_control.no_cache = None
+    response.cache_control.public = False
+    response.cache_control.private = True
+    response.cache_control.max_age = app.config['DOCUMENT_CACHE_SECONDS']
+    return response
+
+def send_stored_file(stream, size, etag, mimetype, as_attachment=False, download_name=None):
+    """يرسل محتوى مخزن مع ETag قوي من بصمة المحتوى، ويرد بـ 304 على If-None-Match و 206 على Range"""
+    response = send_file(stream, mimetype=mimetype, as_attachment=as_attachment, download_name=download_name,
+                         etag=etag, conditional=False)
+    response.content_length = size
+    private_cache(response)
+    return response.make_conditional(request, accept_ranges=True, complete_length=size)
+
+def send_document_file(doc: Document, mimetype=None, as_attachment=False, download_name=None):
+    """يرسل محتوى الوثيقة المخزن (مخزن البصمات أو العمود القديم)"""
+    stored = open_document_file(doc)
+    if stored is None:
+        return "لا يوجد ملف مرفوع لهذه الوثيقة", 404
+    stream, size, etag = stored
+    return send_stored_file(stream, size, etag, mimetype or doc.file_mime or 'application/octet-stream',
+                            as_attachment, download_name or doc.file_name or f"document_{doc.id}")
+
+# -------- تحديد الملف المطلوب في مسارات الملفات القديمة (/uploads, /view_pdf, ...) --------
+# نتيجة البحث عن مسار: الوثيقة المرتبطة (إن وُجدت) وبيانات المحتوى، أو مسار الملف على القرص
+UploadRef = namedtuple('UploadRef', 'doc_id name mime blob_hash blob_size blob_backend legacy_bytes disk_path')
+
+# كاش لكل worker: (المسار، إصدار جدول document) -> UploadRef - أي تعديل لوثيقة في أي worker يغير الإصدار
+upload_ref_cache = LRUCache(maxsize=4096, ttl=int(os.getenv('FILE_LOOKUP_CACHE_SECONDS', '300')))
+
+# مجلدات داخل UPLOAD_FOLDER لا تُعرض عبر مسارات الملفات القديمة
+PRIVATE_UPLOAD_DIRS = ('blobs', 'tmp')
+
+def resolve_upload(filename):
+    """يحدد مصدر الملف المطلوب بالاسم: بحث مفهرس على file_path ثم القرص كاحتياطي"""
+    key = (filename, table_versions(('document',))[0])
+    ref = upload_ref_cache.get(key)
+    if ref is not None:
+        return ref
+    row = db.session.query(
+        Document.id, Document.file_name, Document.file_mime, Document.blob_hash,
+        Blob.size, Blob.backend, db.func.length(Document.file_bytes) > 0
+    ).outerjoin(Blob, Blob.hash == Document.blob_hash).filter(Document.file_path == filename).first()
+    if row and (row[3] or row[6]):
+        ref = UploadRef(row[0], row[1] or filename, row[2], row[3], row[4], row[5], bool(row[6]), None)
+    elif not app.config['LEGACY_DISK_FALLBACK']:
+        return None
+    else:
+        disk_path = safe_join(app.config['UPLOAD_FOLDER'], filename)
+        if (not disk_path or not os.path.isfile(disk_path)
+                or filename.replace('\\', '/').split('/', 1)[0] in PRIVATE_UPLOAD_DIRS):
+            return None
+        ref = UploadRef(row[0] if row else None, filename, None, None, None, None, False, disk_path)
+    upload_ref_cache.set(key, ref)
+    return ref
+
+def send_upload(ref: UploadRef, mimetype=None, as_attachment=False, download_name=None):
+    """يرسل الملف الذي حدده resolve_upload أياً كان مصدره"""
+    import mimetypes
+    mimetype = mimetype or ref.mime or mimetypes.guess_type(ref.name)[0] or 'application/octet-stream'
+    download_name = download_name or ref.name
+    if ref.blob_hash:
+        blob = Blob(hash=ref.blob_hash, size=ref.blob_size, backend=ref.blob_backend)
+        stream = BLOB_BACKENDS[blob.backend].open(blob)
+        return send_stored_file(stream, blob.size, blob.hash, mimetype, as_attachment, download_name)
+    if ref.legacy_bytes:
+        doc = Document.query.options(db.undefer(Document.file_bytes)).get(ref.doc_id)
+        return send_document_file(doc, mimetype, as_attachment, download_name)
+    directory, name = os.path.split(ref.disk_path)
+    response = send_from_directory(directory, name, mimetype=mimetype,
+                                   as_attachment=as_attachment, download_name=download_name)
+    return private_cache(response)
+
+def payment_alert_rows(today: date):
+    """الدفعات غير المسددة المتأخرة أو المستحقة خلال أسبوع مع اسم العميل (استعلام واحد)"""
+    return db.session.query(
+        Payment.client_id, Client.name.label('client_name'),
+        Payment.number, Payment.amount, Payment.next_due_date
+    ).join(Client, Client.id == Payment.client_id).filter(
+        Payment.is_paid == False,
+        Payment.next_due_date <= today + timedelta(days=7)
+    ).all()
+
+def paid_sum_subquery(client_id_column):
+    """مجموع الدفعات المسددة للعميل محسوباً من جدول payment (مرجع paid_total)"""
+    return db.select(db.func.coalesce(db.func.sum(Payment.amount), 0)).where(
+        Payment.client_id == client_id_column, Payment.is_paid == True
+    ).scalar_subquery()
+
+def refresh_paid_total(client_ids=None):
+    """يعيد حساب client.paid_total من الدفعات داخل المعاملة الحالية بدون commit"""
+    db.session.flush()
+    update = db.update(Client).values(paid_total=paid_sum_subquery(Client.id))
+    if client_ids is not None:
+        update = update.where(Client.id.in_(list(client_ids)))
+    db.session.execute(update.execution_options(synchronize_session='fetch'))
+
+def refresh_client_attention(client_ids=None, today: date = None):
+    """يعيد حساب ملخص المتابعة لعملاء محددين (أو لكل العملاء) داخل المعاملة الحالية بدون commit"""
+    today = today or date.today()
+    db.session.flush()
+    unpaid = db.and_(Payment.client_id == Client.id, Payment.is_paid == False)
+    rows = db.select(
+        Client.id,
+        db.select(db.func.count(Document.id)).where(
+            Document.client_id == Client.id,
+            Document.required == True,
+            db.or_(Document.status.is_(None), Document.status != "مكتملة")
+        ).scalar_subquery(),
+        db.select(db.func.count(Payment.id)).where(unpaid, Payment.next_due_date < today).scalar_subquery(),
+        db.select(db.func.min(Payment.next_due_date)).where(unpaid, Payment.next_due_date >= today).scalar_subquery(),
+        db.select(db.func.min(Payment.next_due_date)).where(unpaid, Payment.next_due_date < today).scalar_subquery(),
+    )
+    table = ClientAttention.__table__
+    clear = table.delete()
+    if client_ids is None:
+        # إعادة الحساب الكاملة لا تتداخل مع تحديثات المسارات أثناءها
+        if db.engine.name == 'postgresql':
+            db.session.execute(db.text("LOCK TABLE client_attention IN EXCLUSIVE MODE"))
+    else:
+        client_ids = list(client_ids)
+        if not client_ids:
+            return
+        # قفل صف العميل حتى لا يتسابق طلبان على نفس الملخص
+        db.session.query(Client.id).filter(Client.id.in_(client_ids)).with_for_update().all()
+        rows = rows.where(Client.id.in_(client_ids))
+        clear = clear.where(table.c.client_id.in_(client_ids))
+    db.session.execute(clear)
+    db.session.execute(table.insert().from_select(
+        ['client_id', 'missing_required_docs', 'overdue_payments', 'next_due_date', 'oldest_overdue_date'], rows
+    ))
+
+# حالات العميل المعروضة في صفحات الإحصائيات
+CLIENT_STATUSES = ("جاري", "مكتمل", "مرفوض", "رفع مرة أخرى", "لغا المعاملة")
+
+# كاش الإحصائيات لكل worker - يُمسح عند إضافة عميل أو تغيير حالته، والصلاحية القصيرة تغطي باقي الـ workers
+stats_cache = LRUCache(maxsize=16, ttl=int(os.getenv('STATS_CACHE_SECONDS', '60')))
+
+def count_by_status(query=None) -> dict:
+    """عدد العملاء لكل حالة في استعلام واحد GROUP BY status"""
+    query = Client.query if query is None else query
+    counts = dict.fromkeys(CLIENT_STATUSES, 0)
+    counts.update(query.with_entities(Client.status, db.func.count(Client.id)).group_by(Client.status).all())
+    return counts
+
+def client_stats() -> dict:
+    """إحصائيات العملاء المشتركة (الرئيسية، اختيار القسم، لوحة التحكم، كل العملاء) من الكاش"""
+    stats = stats_cache.get('clients')
+    if stats is None:
+        since = datetime.utcnow() - timedelta(days=30)
+        rows = db.session.query(
+            Client.status,
+            db.func.count(Client.id),
+            db.func.sum(db.case((Client.created_at >= since, 1), else_=0))
+        ).group_by(Client.status).all()
+        by_status = dict.fromkeys(CLIENT_STATUSES, 0)
+        by_status.update((status, count) for status, count, _ in rows)
+        stats = {
+            'total': sum(count for _, count, _ in rows),
+            'by_status': by_status,
+            'new_last_30_days': sum(int(new or 0) for _, _, new in rows),
+        }
+        stats_cache.set('clients', stats)
+    return stats
+
+def invalidate_client_stats():
+    stats_cache.pop('clients')
+
+# آخر السجلات في صفحة العملاء المستاءين: اسم القائمة في القالب -> (النموذج، العدد، الأعمدة المعروضة)
+# العمود من جدول آخر (مثل اسم العميل المرتبط بالمتابعة) يُقرأ بـ outer join على المفتاح الأجنبي
+ACTIVITY_FEED = (
+    ('disappointed_clients', DisappointedClient, 5, ('client_name', 'phone')),
+    ('client_followups', ClientFollowup, 5,
+     ('client_id', DisappointedClient.client_name, 'client_call_date', 'status')),
+    ('legal_cases', LegalCase, 5, ('call_date', 'case_type')),
+    ('refund_payments', RefundPayment, 5, ('client_name', 'amount', 'payment_date')),
+    ('fully_completed_clients', FullyCompletedClient, 5,
+     ('client_name', 'client_phone', 'contract_date', 'paid_amount', 'completion_date')),
+)
+activity_cache = LRUCache(maxsize=4, ttl=int(os.getenv('ACTIVITY_CACHE_SECONDS', '30')))
+
+def activity_slot_kind(column):
+    if isinstance(column.type, db.Date):
+        return 'date', db.Date
+    if isinstance(column.type, db.Integer):
+        return 'integer', db.Integer
+    if isinstance(column.type, db.Float):
+        return 'number', db.Float
+    return 'text', db.String
+
+def activity_column(model, attr):
+    return attr if not isinstance(attr, str) else getattr(model, attr)
+
+def activity_feed_query():
+    """UNION ALL واحد لآخر السجلات من كل جدول (كل جزء يقرأ من فهرس created_at, id)
+    الأعمدة المعروضة توضع في خانات مشتركة حسب النوع: text_0, date_0, number_0 ..."""
+    slots = {}
+    layouts = []
+    for feed, model, _, attrs in ACTIVITY_FEED:
+        used = {}
+        layout = {}
+        for attr in attrs:
+            column = activity_column(model, attr)
+            kind, type_ = activity_slot_kind(column)
+            label = f"{kind}_{used.get(kind, 0)}"
+            used[kind] = used.get(kind, 0) + 1
+            slots[label] = type_
+            layout[label] = column
+        layouts.append(layout)
+    parts = []
+    for (feed, model, limit, _), layout in zip(ACTIVITY_FEED, layouts):
+        columns = [db.literal(feed).label('feed'), model.id.label('id'),
+                   model.created_at.label('created_at'), model.created_by.label('created_by')]
+        columns += [
+            (layout[label] if label in layout else db.cast(db.null(), type_)).label(label)
+            for label, type_ in slots.items()
+        ]
+        branch = db.select(*columns).select_from(model)
+        for joined in dict.fromkeys(c.class_ for c in layout.values() if c.class_ is not model):
+            branch = branch.outerjoin(joined)
+        branch = branch.order_by(model.created_at.desc(), model.id.desc()).limit(limit).subquery()
+        parts.append(db.select(branch))
+    query = db.union_all(*parts).order_by(
+        db.column('feed'), db.column('created_at').desc(), db.column('id').desc()
+    )
+    return query, {feed: {label: column.key for label, column in layout.items()}
+                   for (feed, _, _, _), layout in zip(ACTIVITY_FEED, layouts)}
+
+def recent_activity() -> dict:
+    """قوائم آخر السجلات لصفحة العملاء المستاءين من استعلام واحد - محفوظة في الكاش لفترة قصيرة"""
+    feeds = activity_cache.get('hub')
+    if feeds is None:
+        query, layouts = activity_feed_query()
+        feeds = {feed: [] for feed, _, _, _ in ACTIVITY_FEED}
+        # يتغير مع كل تحميل جديد للقوائم - مفتاح كاش جزء القالب الذي يعرضها
+        feeds['activity_version'] = time.monotonic_ns()
+        for row in db.session.execute(query).mappings():
+            item = {'id': row['id'], 'created_at': row['created_at'], 'created_by': row['created_by']}
+            item.update((attr, row[label]) for label, attr in layouts[row['feed']].items())
+            feeds[row['feed']].append(item)
+        activity_cache.set('hub', feeds)
+    return feeds
+
+def invalidate_activity_feed():
+    activity_cache.pop('hub')
+
+def refresh_stale_attention(today: date):
+    """يعيد حساب ملخص العملاء الذين أصبحت دفعاتهم متأخرة منذ آخر حساب (تغير التاريخ) - قبل قراءة clients_attention_query"""
+    stale = [cid for (cid,) in db.session.query(ClientAttention.client_id).filter(ClientAttention.next_due_date < today)]
+    if stale:
+        refresh_client_attention(stale, today)
+        db.session.commit()
+
+def clients_attention_query(today: date):
+    """العملاء الذين لديهم أوراق مطلوبة ناقصة أو دفعات متأخرة - قراءة مفهرسة من جدول client_attention"""
+    return db.session.query(Client, ClientAttention).join(
+        ClientAttention, ClientAttention.client_id == Client.id
+    ).filter(
+        db.or_(ClientAttention.missing_required_docs > 0, ClientAttention.overdue_payments > 0)
+    )
 
 def next_payment_number(client: Client) -> int:
     if not client.payments:
@@ -378,32 +1228,127 @@ def document_deadline_alerts(client: Client):
     alerts.sort(key=lambda x: (x['type'] == 'danger', x['days']))
     return alerts
 
+# -------- تقسيم القوائم الطويلة إلى صفحات --------
+# الصفحة تُحدد بمؤشر (created_at, id) لآخر صف معروض بدلاً من OFFSET، فسرعة أي صفحة لا تعتمد على عدد الصفوف قبلها
+Page = namedtuple('Page', 'items per_page next_cursor prev_cursor')
+
+def encode_cursor(row) -> str:
+    return f"{row.created_at.isoformat() if row.created_at else ''}_{row.id}"
+
+def decode_cursor(value):
+    if not value:
+        return None
+    created_at, _, row_id = value.rpartition('_')
+    try:
+        return (datetime.fromisoformat(created_at) if created_at else None), int(row_id)
+    except ValueError:
+        return None
+
+def keyset_paginate(query, model) -> Page:
+    """صفحة من الاستعلام مرتبة بالأحدث (created_at DESC, id DESC) حسب ?after= / ?before= و ?per_page="""
+    per_page = request.args.get('per_page', type=int) or app.config['PAGE_SIZE']
+    per_page = max(1, min(per_page, app.config['MAX_PAGE_SIZE']))
+    created_at, row_id = model.created_at, model.id
+    # الصفوف بدون created_at تأتي في آخر القائمة
+    before = decode_cursor(request.args.get('before'))
+    if before:
+        cursor_at, cursor_id = before
+        if cursor_at is None:
+            query = query.filter(db.or_(created_at.isnot(None), row_id > cursor_id))
+        else:
+            query = query.filter(db.or_(created_at > cursor_at, db.and_(created_at == cursor_at, row_id > cursor_id)))
+        rows = query.order_by(created_at.asc().nullsfirst(), row_id.asc()).limit(per_page + 1).all()
+        has_more = len(rows) > per_page
+        rows = rows[:per_page][::-1]
+        return Page(rows, per_page, encode_cursor(rows[-1]) if rows else None,
+                    encode_cursor(rows[0]) if has_more else None)
+
+    after = decode_cursor(request.args.get('after'))
+    if after:
+        cursor_at, cursor_id = after
+        if cursor_at is None:
+            query = query.filter(created_at.is_(None), row_id < cursor_id)
+        else:
+            query = query.filter(db.or_(
+                created_at < cursor_at,
+                db.and_(created_at == cursor_at, row_id < cursor_id),
+                created_at.is_(None)
+            ))
+    rows = query.order_by(created_at.desc().nullslast(), row_id.desc()).limit(per_page + 1).all()
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    return Page(rows, per_page, encode_cursor(rows[-1]) if has_more else None,
+                encode_cursor(rows[0]) if after and rows else None)
+
+@app.template_global()
+def page_url(**cursor):
+    """رابط نفس الصفحة مع الحفاظ على الفلاتر وتغيير المؤشر فقط"""
+    args = request.args.to_dict()
+    args.pop('after', None)
+    args.pop('before', None)
+    args.update(cursor)
+    return url_for(request.endpoint, **(request.view_args or {}), **args)
+
+def load_asset_manifest():
+    """أسماء ملفات static/dist التي أنتجها build_assets.py ({} إذا لم يُشغل بعد)"""
+    try:
+        with open(os.path.join(app.static_folder, 'dist', 'manifest.json'), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+ASSET_MANIFEST = load_asset_manifest()
+# بدون build_assets.py تستخدم القوالب روابط CDN كما كانت
+app.jinja_env.globals['assets_bundled'] = bool(ASSET_MANIFEST)
+
+@app.template_global()
+def asset_url(filename):
+    """رابط الملف باسمه الذي فيه بصمة المحتوى (مثل app.css -> dist/app.1a2b3c4d5e.css)، وإلا رابط static العادي"""
+    return url_for('static', filename=ASSET_MANIFEST.get(filename, filename))
+
+@app.route('/static/dist/<path:filename>')
+def dist_asset(filename):
+    """ملفات build_assets.py - اسم الملف يتغير مع محتواه فيُخزن في المتصفح بلا إعادة تحقق، مع نسخة .gz الجاهزة"""
+    import mimetypes
+    directory = os.path.join(app.static_folder, 'dist')
+    if filename == 'manifest.json':
+        abort(404)
+    max_age = 365 * 24 * 3600
+    gz_path = safe_join(directory, filename + '.gz')
+    has_gz = bool(gz_path) and os.path.isfile(gz_path)
+    if has_gz and request.accept_encodings['gzip']:
+        response = send_from_directory(directory, filename + '.gz', max_age=max_age,
+                                       mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream')
+        response.content_encoding = 'gzip'
+    else:
+        response = send_from_directory(directory, filename, max_age=max_age)
+    if has_gz:
+        response.vary.add('Accept-Encoding')
+    response.cache_control.immutable = True
+    return response
+
 # ------------------ Routes ------------------
 @app.route("/")
 def index():
     """الصفحة الرئيسية - اختيار القسم"""
     # إحصائيات سريعة للصفحة الرئيسية
-    total_clients = Client.query.count()
-    completed_clients = Client.query.filter_by(status="مكتمل").count()
-    in_progress_clients = Client.query.filter_by(status="جاري").count()
+    stats = client_stats()
     
     return render_template("choose_section.html",
-                         total_clients=total_clients,
-                         completed_clients=completed_clients,
-                         in_progress_clients=in_progress_clients)
+                         total_clients=stats['total'],
+                         completed_clients=stats['by_status']["مكتمل"],
+                         in_progress_clients=stats['by_status']["جاري"])
 
 @app.route("/choose_section")
 def choose_section():
     """صفحة اختيار القسم"""
     # إحصائيات سريعة للصفحة الرئيسية
-    total_clients = Client.query.count()
-    completed_clients = Client.query.filter_by(status="مكتمل").count()
-    in_progress_clients = Client.query.filter_by(status="جاري").count()
+    stats = client_stats()
     
     return render_template("choose_section.html",
-                         total_clients=total_clients,
-                         completed_clients=completed_clients,
-                         in_progress_clients=in_progress_clients)
+                         total_clients=stats['total'],
+                         completed_clients=stats['by_status']["مكتمل"],
+                         in_progress_clients=stats['by_status']["جاري"])
 
 @app.route("/disappointed_clients")
 def disappointed_clients():
@@ -413,38 +1358,14 @@ def disappointed_clients():
         flash("يجب تسجيل الدخول أولاً", "error")
         return redirect(url_for('login'))
     
-    # جلب البيانات من الجداول الثلاثة
-    disappointed_clients = DisappointedClient.query.order_by(DisappointedClient.created_at.desc()).limit(5).all()
-    client_followups = ClientFollowup.query.order_by(ClientFollowup.created_at.desc()).limit(5).all()
-    legal_cases = LegalCase.query.order_by(LegalCase.created_at.desc()).limit(5).all()
-    
-    # جلب العملاء المكتملين
-    completed_clients = CompletedClient.query.order_by(CompletedClient.created_at.desc()).limit(10).all()
-    
-    # جلب العملاء في انتظار الشئون القانونية
-    pending_legal_clients = PendingLegalClient.query.order_by(PendingLegalClient.created_at.desc()).limit(10).all()
-    
-    # جلب آخر 5 عملاء مكتملين بالكامل
-    fully_completed_clients = FullyCompletedClient.query.order_by(FullyCompletedClient.created_at.desc()).limit(5).all()
-    
-    # جلب آخر 5 دفعات استرداد
-    refund_payments = RefundPayment.query.order_by(RefundPayment.created_at.desc()).limit(5).all()
-    
-    return render_template("disappointed_clients.html",
-                         disappointed_clients=disappointed_clients,
-                         client_followups=client_followups,
-                         legal_cases=legal_cases,
-                         completed_clients=completed_clients,
-                         pending_legal_clients=pending_legal_clients,
-                         fully_completed_clients=fully_completed_clients,
-                         refund_payments=refund_payments)
+    return render_template("disappointed_clients.html", **recent_activity())
 
 @app.route("/file_management")
 def file_management():
     """صفحة إدارة الملفات للعملاء المستاءين"""
     # جلب قائمة العملاء الحاليين
-    current_clients = DisappointedClient.query.order_by(DisappointedClient.created_at.desc()).all()
-    return render_template("file_management.html", current_clients=current_clients)
+    page = keyset_paginate(DisappointedClient.query, DisappointedClient)
+    return render_template("file_management.html", current_clients=page.items, page=page)
 
 @app.route("/add_disappointed_client", methods=["POST"])
 def add_disappointed_client():
@@ -487,6 +1408,7 @@ def add_disappointed_client():
         
         db.session.add(disappointed_client)
         db.session.commit()
+        invalidate_activity_feed()
         
         flash("تم إضافة العميل المستاء بنجاح!", "success")
         
@@ -500,17 +1422,18 @@ def add_disappointed_client():
 def client_followup():
     """صفحة متابعة العميل المستاء"""
     # جلب قائمة المتابعات الحالية مع أسماء العملاء
-    current_followups = ClientFollowup.query.order_by(ClientFollowup.created_at.desc()).all()
+    page = keyset_paginate(ClientFollowup.query.options(db.joinedload(ClientFollowup.client)), ClientFollowup)
+    current_followups = page.items
     
-    # جلب أسماء العملاء للمتابعات المرتبطة
+    # أسماء العملاء للمتابعات المرتبطة (محملة مع المتابعات في نفس الاستعلام)
     for followup in current_followups:
         if followup.client_id:
-            client = DisappointedClient.query.get(followup.client_id)
+            client = followup.client
             followup.client_name = client.client_name if client else "عميل محذوف"
         else:
             followup.client_name = "غير مرتبط"
     
-    return render_template("client_followup.html", current_followups=current_followups)
+    return render_template("client_followup.html", current_followups=current_followups, page=page)
 
 @app.route("/client_followup/<int:client_id>")
 def client_followup_with_data(client_id):
@@ -560,6 +1483,7 @@ def add_client_followup():
         
         db.session.add(followup)
         db.session.commit()
+        invalidate_activity_feed()
         
         flash("تم إضافة المتابعة بنجاح!", "success")
         
@@ -579,19 +1503,17 @@ def add_client_followup():
 def legal_affairs():
     """صفحة الشئون القانونية"""
     # جلب قائمة القضايا الحالية
-    current_cases = LegalCase.query.order_by(LegalCase.created_at.desc()).all()
-    return render_template("legal_affairs.html", current_cases=current_cases)
+    page = keyset_paginate(LegalCase.query, LegalCase)
+    return render_template("legal_affairs.html", current_cases=page.items, page=page)
 
 @app.route("/legal_affairs/<int:followup_id>")
 def legal_affairs_with_client(followup_id):
     """صفحة الشئون القانونية مع بيانات العميل من إدارة الملفات ومتابعة العميل المستاء"""
     # جلب المتابعة
-    followup = ClientFollowup.query.get_or_404(followup_id)
+    followup = ClientFollowup.query.options(db.joinedload(ClientFollowup.client)).get_or_404(followup_id)
     
-    # جلب بيانات العميل من إدارة الملفات إذا كان مرتبط
-    file_client = None
-    if followup.client_id:
-        file_client = DisappointedClient.query.get(followup.client_id)
+    # بيانات العميل من إدارة الملفات إذا كان مرتبط
+    file_client = followup.client
     
     return render_template("legal_affairs.html", 
                          followup=followup,
@@ -623,9 +1545,9 @@ def add_legal_case():
         file_client = None
         
         if followup_id:
-            followup = ClientFollowup.query.get(followup_id)
-            if followup and followup.client_id:
-                file_client = DisappointedClient.query.get(followup.client_id)
+            followup = ClientFollowup.query.options(db.joinedload(ClientFollowup.client)).get(followup_id)
+            if followup:
+                file_client = followup.client
         
         # إنشاء سجل العميل المكتمل بالكامل
         fully_completed_client = FullyCompletedClient(
@@ -673,6 +1595,7 @@ def add_legal_case():
             db.session.delete(followup)
         
         db.session.commit()
+        invalidate_activity_feed()
         
         flash("تم إكمال جميع المراحل وإضافة العميل إلى قائمة العملاء المكتملين بالكامل!", "success")
         
@@ -689,13 +1612,14 @@ def add_legal_case():
 def refund_payments():
     """صفحة دفعات الاسترداد"""
     # جلب قائمة دفعات الاسترداد الحالية
-    current_payments = RefundPayment.query.order_by(RefundPayment.created_at.desc()).all()
+    page = keyset_paginate(RefundPayment.query, RefundPayment)
     
     # جلب قائمة العملاء المكتملين بالكامل للاختيار منها
     fully_completed_clients = FullyCompletedClient.query.order_by(FullyCompletedClient.client_name).all()
     
     return render_template("refund_payments.html", 
-                         current_payments=current_payments,
+                         current_payments=page.items,
+                         page=page,
                          fully_completed_clients=fully_completed_clients)
 
 @app.route("/add_refund_payment", methods=["POST"])
@@ -732,6 +1656,7 @@ def add_refund_payment():
         
         db.session.add(payment)
         db.session.commit()
+        invalidate_activity_feed()
         
         flash("تم إضافة دفعة الاسترداد بنجاح!", "success")
         
@@ -741,6 +1666,23 @@ def add_refund_payment():
     
     return redirect(url_for('refund_payments'))
 
+@app.route("/api/suggest")
+def api_suggest():
+    """اقتراحات أثناء الكتابة: أقرب العملاء في العقود وكل مراحل الشكاوى بالاسم أو الهاتف"""
+    if not session.get('user_id'):
+        return jsonify({'error': 'unauthorized'}), 401
+    query = request.args.get('q', '')
+    entities = set(request.args.get('entities', '').split(',')) - {''}
+    limit = min(request.args.get('limit', SUGGEST_LIMIT, type=int) or SUGGEST_LIMIT, 50)
+    # "010 1234" أو "+20 10..." تُبحث كبداية رقم واحد
+    digits = phone_prefix(query)
+    tokens = [digits] if digits else normalize_text(query).split()
+    accept = (lambda hit: hit['entity'] in entities) if entities else None
+    hits = get_suggest_index().search(tokens, limit=limit, accept=accept)
+    return jsonify({'results': [
+        dict(hit, url=suggest_url(hit['entity'], hit['id'], hit['name'])) for hit in hits
+    ]})
+
 @app.route("/search_client")
 def search_client():
     """البحث عن عميل بالاسم أو رقم الهاتف - يجلب كل المراحل والدفعات"""
@@ -760,128 +1702,55 @@ def search_client():
         flash("من فضلك أدخل اسم العميل أو رقم الهاتف", "warning")
         return redirect(url_for('disappointed_clients'))
     
-    # المرحلة 1: البحث في جدول إدارة الملفات (DisappointedClient)
-    file_query = DisappointedClient.query
-    if client_name and client_phone:
-        file_client = file_query.filter(
-            (DisappointedClient.client_name.ilike(f'%{client_name}%')) | 
-            (DisappointedClient.phone.ilike(f'%{client_phone}%'))
-        ).first()
-    elif client_name:
-        file_client = file_query.filter(DisappointedClient.client_name.ilike(f'%{client_name}%')).first()
-    else:
-        file_client = file_query.filter(DisappointedClient.phone.ilike(f'%{client_phone}%')).first()
+    # استعلام واحد مرتب في فهرس البحث لكل المراحل (الاسم أو الهاتف)
+    # البحث وآخر السجلات مستقلان، ثم تحميل صفوف كل مرحلة من نتائج البحث بالتوازي
+    first = read_fanout.run(
+        hits=lambda: search_index(client_name, client_phone, entities=['disappointed', 'fully_completed', 'refund']),
+        activity=recent_activity,
+    )
+    hits = first['hits']
+    loaded = read_fanout.run(
+        # المرحلة 1: أقرب عميل في إدارة الملفات مع متابعاته وقضاياه القانونية
+        file_client=lambda: load_search_hits(
+            [h for h in hits if h.entity == 'disappointed'][:1],
+            'disappointed',
+            [db.selectinload(DisappointedClient.followups).selectinload(ClientFollowup.legal_cases)]
+        ),
+        # المرحلة 2: أقرب عميل مكتمل بالكامل مع دفعات الاسترداد المرتبطة به
+        fully_completed=lambda: load_search_hits(
+            [h for h in hits if h.entity == 'fully_completed'][:1],
+            'fully_completed',
+            [db.selectinload(FullyCompletedClient.refund_payments)]
+        ),
+        refunds=lambda: load_search_hits(hits, 'refund'),
+    )
+    file_client = next(iter(loaded['file_client']), None)
     
     if file_client:
         search_results['file_management'] = file_client
-        
-        # المرحلة 2: البحث عن جميع المتابعات المرتبطة بهذا العميل
-        followups = ClientFollowup.query.filter_by(client_id=file_client.id).all()
-        search_results['followups'] = followups
-        
-        # المرحلة 3: البحث عن جميع القضايا القانونية المرتبطة بالمتابعات
-        for followup in followups:
-            legal_cases = LegalCase.query.filter_by(followup_id=followup.id).all()
-            search_results['legal_cases'].extend(legal_cases)
-    
-    # المرحلة 4: البحث في جدول العملاء المكتملين بالكامل
-    fc_query = FullyCompletedClient.query
-    if client_name and client_phone:
-        fully_completed = fc_query.filter(
-            (FullyCompletedClient.client_name.ilike(f'%{client_name}%')) | 
-            (FullyCompletedClient.client_phone.ilike(f'%{client_phone}%'))
-        ).first()
-    elif client_name:
-        fully_completed = fc_query.filter(FullyCompletedClient.client_name.ilike(f'%{client_name}%')).first()
-    else:
-        fully_completed = fc_query.filter(FullyCompletedClient.client_phone.ilike(f'%{client_phone}%')).first()
-    
-    if fully_completed:
-        search_results['fully_completed'] = fully_completed
-    
-    # المرحلة 5: البحث عن جميع دفعات الاسترداد بكل الطرق الممكنة
-    all_refund_payments = []
-    
-    # أولاً: البحث بالربط مع العميل المكتمل (إذا وُجد)
-    if fully_completed:
-        payments_by_id = RefundPayment.query.filter_by(client_id=fully_completed.id).all()
-        all_refund_payments.extend(payments_by_id)
-    
-    # ثانياً: البحث بالاسم ورقم الهاتف مباشرة في جدول دفعات الاسترداد
-    rp_query = RefundPayment.query
-    if client_name and client_phone:
-        # البحث بالاسم أو الهاتف
-        payments_by_search = rp_query.filter(
-            (RefundPayment.client_name.ilike(f'%{client_name}%')) | 
-            (RefundPayment.client_phone.ilike(f'%{client_phone}%'))
-        ).all()
-    elif client_name:
-        # البحث بالاسم فقط
-        payments_by_search = rp_query.filter(
-            RefundPayment.client_name.ilike(f'%{client_name}%')
-        ).all()
-    else:
-        # البحث بالهاتف فقط
-        payments_by_search = rp_query.filter(
-            RefundPayment.client_phone.ilike(f'%{client_phone}%')
-        ).all()
+        search_results['followups'] = list(file_client.followups)
+        for followup in file_client.followups:
+            search_results['legal_cases'].extend(followup.legal_cases)
     
-    # دمج النتائج وإزالة التكرارات
-    all_payment_ids = set()
-    unique_payments = []
+    fully_completed = next(iter(loaded['fully_completed']), None)
+    search_results['fully_completed'] = fully_completed
     
-    for payment in all_refund_payments + payments_by_search:
-        if payment.id not in all_payment_ids:
-            all_payment_ids.add(payment.id)
-            unique_payments.append(payment)
+    # المرحلة 3: دفعات الاسترداد المرتبطة + المطابقة بالاسم/الهاتف مباشرة بدون تكرار
+    payments = list(fully_completed.refund_payments) if fully_completed else []
+    seen_ids = {payment.id for payment in payments}
+    for payment in loaded['refunds']:
+        if payment.id not in seen_ids:
+            seen_ids.add(payment.id)
+            payments.append(payment)
     
-    search_results['refund_payments'] = unique_payments
-    
-    # حساب إجمالي المبالغ المستردة
-    total_refund = sum(payment.amount for payment in unique_payments)
-    search_results['total_refund'] = total_refund
-    
-    # المرحلة 6: البحث في جدول المتابعات بدون ربط (إذا لم نجد في إدارة الملفات)
-    if not file_client:
-        # البحث في ClientFollowup بالاسم (قد تكون هناك متابعات غير مرتبطة)
-        followup_query = ClientFollowup.query
-        if client_name:
-            unlinked_followups = followup_query.join(
-                DisappointedClient, 
-                ClientFollowup.client_id == DisappointedClient.id, 
-                isouter=True
-            ).filter(
-                DisappointedClient.client_name.ilike(f'%{client_name}%') if client_name else True
-            ).all()
-            
-            if unlinked_followups:
-                search_results['followups'].extend(unlinked_followups)
-                
-                # البحث عن القضايا القانونية المرتبطة
-                for followup in unlinked_followups:
-                    legal_cases = LegalCase.query.filter_by(followup_id=followup.id).all()
-                    search_results['legal_cases'].extend(legal_cases)
-    
-    # جلب البيانات الأخرى للصفحة الرئيسية
-    disappointed_clients = DisappointedClient.query.order_by(DisappointedClient.created_at.desc()).limit(5).all()
-    client_followups = ClientFollowup.query.order_by(ClientFollowup.created_at.desc()).limit(5).all()
-    legal_cases = LegalCase.query.order_by(LegalCase.created_at.desc()).limit(5).all()
-    completed_clients = CompletedClient.query.order_by(CompletedClient.created_at.desc()).limit(10).all()
-    pending_legal_clients = PendingLegalClient.query.order_by(PendingLegalClient.created_at.desc()).limit(10).all()
-    fully_completed_clients = FullyCompletedClient.query.order_by(FullyCompletedClient.created_at.desc()).limit(5).all()
-    refund_payments_list = RefundPayment.query.order_by(RefundPayment.created_at.desc()).limit(5).all()
+    search_results['refund_payments'] = payments
+    search_results['total_refund'] = sum(payment.amount for payment in payments)
     
     return render_template("disappointed_clients.html",
-                         disappointed_clients=disappointed_clients,
-                         client_followups=client_followups,
-                         legal_cases=legal_cases,
-                         completed_clients=completed_clients,
-                         pending_legal_clients=pending_legal_clients,
-                         fully_completed_clients=fully_completed_clients,
-                         refund_payments=refund_payments_list,
                          search_results=search_results,
                          search_name=client_name,
-                         search_phone=client_phone)
+                         search_phone=client_phone,
+                         **first['activity'])
 
 # Route لإضافة عميل مكتمل من إدارة الملفات
 @app.route("/complete_file_management/<int:client_id>", methods=["POST"])
@@ -935,6 +1804,7 @@ def complete_file_management(client_id):
         db.session.add(fully_completed_client)
         db.session.delete(client)  # حذف العميل من الجدول الأصلي
         db.session.commit()
+        invalidate_activity_feed()
         
         flash("تم إضافة العميل إلى قائمة العملاء المكتملين!", "success")
         
@@ -953,8 +1823,8 @@ def complete_client_followup(followup_id):
         return redirect(url_for('login'))
     
     try:
-        # جلب المتابعة من قاعدة البيانات
-        followup = ClientFollowup.query.get_or_404(followup_id)
+        # جلب المتابعة من قاعدة البيانات مع العميل المرتبط
+        followup = ClientFollowup.query.options(db.joinedload(ClientFollowup.client)).get_or_404(followup_id)
         
         # جلب بيانات العميل الأصلي إذا كان مرتبط
         original_client_data = None
@@ -962,8 +1832,8 @@ def complete_client_followup(followup_id):
         client_phone = "غير محدد"
         
         if followup.client_id:
-            # جلب العميل الأصلي من جدول إدارة الملفات
-            original_client = DisappointedClient.query.get(followup.client_id)
+            # العميل الأصلي من جدول إدارة الملفات
+            original_client = followup.client
             if original_client:
                 client_name = original_client.client_name
                 client_phone = original_client.phone
@@ -1035,6 +1905,7 @@ def complete_client_followup(followup_id):
         db.session.add(fully_completed_client)
         db.session.delete(followup)  # حذف المتابعة من الجدول الأصلي
         db.session.commit()
+        invalidate_activity_feed()
         
         flash("تم إضافة العميل إلى قائمة العملاء المكتملين بالكامل!", "success")
         
@@ -1054,17 +1925,18 @@ def complete_legal_case(case_id):
     
     try:
         # جلب القضية من قاعدة البيانات
-        case = LegalCase.query.get_or_404(case_id)
+        case = LegalCase.query.options(
+            db.joinedload(LegalCase.followup).joinedload(ClientFollowup.client)
+        ).get_or_404(case_id)
         
         # البحث عن المتابعة المرتبطة بهذه القضية (إذا كانت موجودة)
         followup = None
         file_client = None
         
         # محاولة العثور على المتابعة المرتبطة
-        if hasattr(case, 'followup_id') and case.followup_id:
-            followup = ClientFollowup.query.get(case.followup_id)
-            if followup and followup.client_id:
-                file_client = DisappointedClient.query.get(followup.client_id)
+        if case.followup:
+            followup = case.followup
+            file_client = followup.client
         
         # إنشاء بيانات العميل المكتمل
         client_name = "عميل قضية قانونية"
@@ -1147,6 +2019,7 @@ def complete_legal_case(case_id):
             db.session.add(completed_client)
         db.session.delete(case)  # حذف القضية من الجدول الأصلي
         db.session.commit()
+        invalidate_activity_feed()
         
         flash("تم إضافة العميل والقضية القانونية إلى قائمة العملاء المكتملين!", "success")
         
@@ -1340,10 +2213,12 @@ def pending_legal_client_details(client_id):
 @app.route("/fully_completed_client_details/<int:client_id>")
 def fully_completed_client_details(client_id):
     """عرض تفاصيل العميل المكتمل بالكامل"""
-    fully_client = FullyCompletedClient.query.get_or_404(client_id)
+    fully_client = FullyCompletedClient.query.options(
+        db.selectinload(FullyCompletedClient.refund_payments)
+    ).get_or_404(client_id)
     
-    # جلب دفعات الاسترداد المرتبطة بهذا العميل
-    refund_payments = RefundPayment.query.filter_by(client_id=client_id).all()
+    # دفعات الاسترداد المرتبطة بهذا العميل
+    refund_payments = fully_client.refund_payments
     
     # حساب إجمالي المبالغ المستردة
     total_refund = sum(payment.amount for payment in refund_payments) if refund_payments else 0
@@ -1356,10 +2231,26 @@ def fully_completed_client_details(client_id):
 @app.route("/all_fully_completed_clients")
 def all_fully_completed_clients():
     """عرض جميع العملاء المكتملين بالكامل"""
-    # جلب جميع العملاء المكتملين بالكامل
-    all_clients = FullyCompletedClient.query.order_by(FullyCompletedClient.created_at.desc()).all()
+    # جلب العملاء المكتملين بالكامل صفحة صفحة
+    page = keyset_paginate(FullyCompletedClient.query, FullyCompletedClient)
+    
+    # الإحصائيات على كل العملاء في استعلام واحد
+    has_legal = db.and_(FullyCompletedClient.legal_created_by.isnot(None), FullyCompletedClient.legal_created_by != '')
+    has_followup = db.and_(FullyCompletedClient.followup_created_by.isnot(None), FullyCompletedClient.followup_created_by != '')
+    total, all_stages, until_followup, files_only = db.session.query(
+        db.func.count(FullyCompletedClient.id),
+        db.func.sum(db.case((has_legal, 1), else_=0)),
+        db.func.sum(db.case((db.and_(has_followup, db.not_(has_legal)), 1), else_=0)),
+        db.func.sum(db.case((db.not_(has_followup), 1), else_=0))
+    ).one()
+    stats = {
+        'total': total,
+        'all_stages': all_stages or 0,
+        'until_followup': until_followup or 0,
+        'files_only': files_only or 0,
+    }
     
-    return render_template("all_fully_completed_clients.html", clients=all_clients)
+    return render_template("all_fully_completed_clients.html", clients=page.items, page=page, stats=stats)
 
 @app.route("/client_profile/<int:client_id>")
 def client_profile(client_id):
@@ -1410,8 +2301,8 @@ def logout():
 def user_management():
     """صفحة إدارة المستخدمين"""
     # عرض جميع المستخدمين
-    users = User.query.order_by(User.created_at.desc()).all()
-    return render_template("user_management.html", users=users)
+    page = keyset_paginate(User.query, User)
+    return render_template("user_management.html", users=page.items, page=page)
 
 @app.route("/add_user", methods=["POST"])
 def add_user():
@@ -1479,99 +2370,65 @@ def dashboard():
     # التحقق من عرض جميع العملاء
     show_all = request.args.get('show_all', 'false').lower() == 'true'
     
-    if search_query:
-        # البحث بالاسم أو رقم الهاتف
-        search_results = Client.query.filter(
-            db.or_(
-                Client.name.ilike(f'%{search_query}%'),
-                Client.phone.ilike(f'%{search_query}%')
-            )
-        ).all()
-    
-    # إحصائيات العملاء
-    total_clients = Client.query.count()
-    completed_clients = Client.query.filter_by(status="مكتمل").count()
-    in_progress_clients = Client.query.filter_by(status="جاري").count()
-    rejected_clients = Client.query.filter_by(status="مرفوض").count()
-    resubmit_clients = Client.query.filter_by(status="رفع مرة أخرى").count()
-    cancelled_clients = Client.query.filter_by(status="لغا المعاملة").count()
+    # إحصائيات العملاء (من كاش الإحصائيات)
+    stats = client_stats()
+    total_clients = stats['total']
+    completed_clients = stats['by_status']["مكتمل"]
+    in_progress_clients = stats['by_status']["جاري"]
+    rejected_clients = stats['by_status']["مرفوض"]
+    resubmit_clients = stats['by_status']["رفع مرة أخرى"]
+    cancelled_clients = stats['by_status']["لغا المعاملة"]
     incomplete_clients = total_clients - completed_clients
     
     # العملاء الجدد في آخر 30 يوم
-    thirty_days_ago = datetime.utcnow() - timedelta(days=30)
-    new_clients = Client.query.filter(Client.created_at >= thirty_days_ago).count()
+    new_clients = stats['new_last_30_days']
     
 
     
-    # تنبيهات الدفعات القادمة
+    # قراءات مستقلة (البحث، الدفعات، المتابعة، آخر العملاء) تُنفذ بالتوازي
     today = date.today()
-    upcoming_payments = []
-    
-    # الدفعات التي اقترب موعدها (خلال أسبوع)
-    payments_due_soon = Payment.query.filter(
-        Payment.is_paid == False,
-        Payment.next_due_date >= today,
-        Payment.next_due_date <= today + timedelta(days=7)
-    ).all()
-    
-    for payment in payments_due_soon:
-        client = Client.query.get(payment.client_id)
-        days_left = (payment.next_due_date - today).days
-        upcoming_payments.append({
-            'client_name': client.name,
-            'client_id': client.id,
-            'payment_number': payment.number,
-            'amount': payment.amount,
-            'due_date': payment.next_due_date,
-            'days_left': days_left,
-            'type': 'قريب'
-        })
-    
-    # الدفعات المتأخرة
-    overdue_payments = Payment.query.filter(
-        Payment.is_paid == False,
-        Payment.next_due_date < today
-    ).all()
-    
-    for payment in overdue_payments:
-        client = Client.query.get(payment.client_id)
-        days_overdue = (today - payment.next_due_date).days
-        upcoming_payments.append({
-            'client_name': client.name,
-            'client_id': client.id,
-            'payment_number': payment.number,
-            'amount': payment.amount,
-            'due_date': payment.next_due_date,
-            'days_left': -days_overdue,
-            'type': 'متأخر'
-        })
+    # التحديث (كتابة) في thread الطلب، والقراءات فقط تُنفذ بالتوازي
+    refresh_stale_attention(today)
+    snapshot_table_versions()
+    reads = read_fanout.run(
+        # البحث بالاسم أو رقم الهاتف من فهرس البحث
+        search=lambda: load_search_hits(search_index(search_query, entities=['client']), 'client') if search_query else [],
+        payments=lambda: payment_alert_rows(today),
+        attention=lambda: clients_attention_query(today).order_by(Client.created_at.desc()).all(),
+        # جلب العملاء - إما آخر 5 أو جميع العملاء
+        clients=lambda: Client.query.order_by(Client.created_at.desc()).limit(None if show_all else 5).all(),
+    )
+    search_results = reads['search']
+    clients_to_show = reads['clients']
+    
+    # تنبيهات الدفعات القادمة والمتأخرة
+    upcoming_payments = [
+        {
+            'client_name': p.client_name,
+            'client_id': p.client_id,
+            'payment_number': p.number,
+            'amount': p.amount,
+            'due_date': p.next_due_date,
+            'days_left': (p.next_due_date - today).days,
+            'type': 'متأخر' if p.next_due_date < today else 'قريب'
+        }
+        for p in reads['payments']
+    ]
     
     # ترتيب التنبيهات (المتأخرة أولاً، ثم القريبة)
     upcoming_payments.sort(key=lambda x: (x['type'] == 'متأخر', x['days_left']))
     
     # العملاء الذين يحتاجون متابعة (أوراق ناقصة أو دفعات متأخرة)
-    clients_needing_attention = []
-    
-    # جلب العملاء - إما آخر 5 أو جميع العملاء
-    if show_all:
-        all_clients = Client.query.order_by(Client.created_at.desc()).all()
-        clients_to_show = all_clients
-    else:
-        all_clients = Client.query.order_by(Client.created_at.desc()).all()
-        clients_to_show = all_clients[:5]  # عرض آخر 5 عملاء فقط
-    
-    for client in all_clients:
-        missing_docs = len([d for d in client.documents if d.required and d.status != "مكتملة"])
-        overdue_payments_count = len([p for p in client.payments if not p.is_paid and p.next_due_date and p.next_due_date < today])
-        
-        if missing_docs > 0 or overdue_payments_count > 0:
-            clients_needing_attention.append({
-                'id': client.id,
-                'name': client.name,
-                'missing_docs': missing_docs,
-                'overdue_payments': overdue_payments_count,
-                'status': client.status
-            })
+    clients_needing_attention = [
+        {
+            'id': client.id,
+            'name': client.name,
+            'missing_docs': summary.missing_required_docs,
+            'overdue_payments': summary.overdue_payments,
+            'status': client.status
+        }
+        for client, summary in reads['attention']
+    ]
     
     return render_template("dashboard.html",
                          search_query=search_query,
@@ -1586,7 +2443,8 @@ def dashboard():
                          upcoming_payments=upcoming_payments,
                          clients_needing_attention=clients_needing_attention,
                          all_clients=clients_to_show,
-                         show_all=show_all)
+                         show_all=show_all,
+                         today=today)
 
 @app.route("/debug/db")
 def debug_db():
@@ -1628,6 +2486,7 @@ def add_contract():
         client = Client(name=name, phone=phone, visa_type=visa_type, total_amount=total_amount)
         db.session.add(client)
         db.session.commit()
+        invalidate_client_stats()
 
         # إضافة الوثائق الافتراضية
         seed_documents_for_client(client.id)
@@ -1638,6 +2497,7 @@ def add_contract():
 
 @app.route("/client/<int:client_id>")
 def client_detail(client_id):
+    snapshot_table_versions()
     client = Client.query.get_or_404(client_id)
 
     # تنبيهات الدفعات + قائمة الأوراق الناقصة (إجباري)
@@ -1666,7 +2526,8 @@ def client_detail(client_id):
         follows=follows,
         pay_alerts=pay_alerts,
         missing_required_docs=missing_required_docs,
-        deadline_alerts=deadline_alerts
+        deadline_alerts=deadline_alerts,
+        today=date.today()
     )
 
 # -------- دفعات --------
@@ -1697,6 +2558,8 @@ def add_payment(client_id):
         payment_type=payment_type
     )
     db.session.add(payment)
+    refresh_paid_total([client.id])
+    refresh_client_attention([client.id])
     db.session.commit()
     flash("تم إضافة حركة الدفعة.", "success")
     return redirect(url_for("client_detail", client_id=client_id))
@@ -1710,6 +2573,8 @@ def mark_payment_paid(client_id, payment_id):
     if not payment.is_paid:
         payment.is_paid = True
         payment.paid_date = date.today()
+        refresh_paid_total([client_id])
+        refresh_client_attention([client_id])
         db.session.commit()
         flash("تم تسجيل الدفعة كمدفوعة وإزالة التنبيه.", "success")
     return redirect(url_for("client_detail", client_id=client_id))
@@ -1721,6 +2586,8 @@ def delete_payment(client_id, payment_id):
     
     # حذف الدفعة
     db.session.delete(payment)
+    refresh_paid_total([client_id])
+    refresh_client_attention([client_id])
     db.session.commit()
     flash("تم حذف الدفعة بنجاح.", "success")
     return redirect(url_for("client_detail", client_id=client_id))
@@ -1737,15 +2604,23 @@ def upload_document(client_id, doc_id):
 
     # حفظ اسم الملف الأصلي
     original_filename = secure_filename(file.filename)
-    # قراءة المحتوى وتحديد النوع والحجم
-    data = file.read()
+    # تحديد النوع
     import mimetypes
     guessed_mime, _ = mimetypes.guess_type(original_filename)
     file_mime = file.mimetype or guessed_mime or 'application/octet-stream'
-    file_size = len(data) if data is not None else 0
 
-    # حفظ داخل قاعدة البيانات
-    doc.file_bytes = data
+    # حفظ المحتوى في مخزن البصمات على أجزاء (نسخة واحدة لكل محتوى مهما تكرر رفعه)
+    old_blob_hash = doc.blob_hash
+    try:
+        blob = store_blob(file.stream, app.config['MAX_CONTENT_LENGTH'])
+    except BlobTooLarge:
+        db.session.rollback()
+        flash(f"حجم الملف أكبر من الحد المسموح ({app.config['MAX_CONTENT_LENGTH'] // (1024 * 1024)} ميجابايت).", "danger")
+        return redirect(url_for("client_detail", client_id=client_id))
+    file_size = blob.size
+    release_blob(old_blob_hash)
+    doc.blob_hash = blob.hash
+    doc.file_bytes = None
     doc.file_name = original_filename
     doc.file_mime = file_mime
     doc.file_size = file_size
@@ -1759,6 +2634,7 @@ def upload_document(client_id, doc_id):
     doc.deadline_end = None
     doc.deadline_warning_days = 7
     
+    refresh_client_attention([client_id])
     db.session.commit()
     
     # رسالة نجاح مع نوع الملف
@@ -1767,185 +2643,86 @@ def upload_document(client_id, doc_id):
     flash(f"تم رفع {file_type} '{original_filename}' وإزالة المواعيد النهائية بنجاح.", "success")
     return redirect(url_for("client_detail", client_id=client_id))
 
+@app.errorhandler(413)
+def upload_too_large(e):
+    """رفض الملفات الأكبر من MAX_CONTENT_LENGTH قبل قراءتها"""
+    flash(f"حجم الملف أكبر من الحد المسموح ({app.config['MAX_CONTENT_LENGTH'] // (1024 * 1024)} ميجابايت).", "danger")
+    return redirect(request.referrer or url_for("dashboard"))
+
 @app.route("/uploads/<path:filename>")
 def uploaded_file(filename):
-    # محاولة إيجاد الوثيقة في قاعدة البيانات عبر file_path القديم
-    doc = Document.query.filter_by(file_path=filename).first()
-    if doc and doc.file_bytes:
-        import io
-        mime_type = doc.file_mime or 'application/octet-stream'
-        return send_file(io.BytesIO(doc.file_bytes), mimetype=mime_type, as_attachment=False, download_name=doc.file_name or filename)
-    
-    # fallback: من القرص إذا لم تكن موجودة في قاعدة البيانات
-    file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-    if not os.path.exists(file_path):
+    ref = resolve_upload(filename)
+    if ref is None:
         return "الملف غير موجود", 404
-    import mimetypes
-    mime_type, _ = mimetypes.guess_type(file_path)
-    if mime_type == 'application/pdf':
-        return send_file(file_path, mimetype='application/pdf', as_attachment=False)
-    return send_from_directory(app.config['UPLOAD_FOLDER'], filename, as_attachment=False)
+    return send_upload(ref)
 
 @app.route("/view_pdf/<path:filename>")
 def view_pdf(filename):
     """عرض ملف PDF في المتصفح مع واجهة محسنة"""
-    # محاولة القراءة من قاعدة البيانات أولاً
-    doc = Document.query.filter_by(file_path=filename).first()
-    if doc and doc.file_bytes:
-        import io
-        response = send_file(io.BytesIO(doc.file_bytes), mimetype='application/pdf', as_attachment=False, download_name=doc.file_name or filename)
-        response.headers['Content-Disposition'] = 'inline; filename="' + (doc.file_name or filename) + '"'
-        response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
-        response.headers['Pragma'] = 'no-cache'
-        response.headers['Expires'] = '0'
-        return response
-    
-    # fallback للقرص
-    file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-    if not os.path.exists(file_path):
+    ref = resolve_upload(filename)
+    if ref is None:
         return "الملف غير موجود", 404
-    if not filename.lower().endswith('.pdf'):
+    if not ref.name.lower().endswith('.pdf'):
         return "هذا الملف ليس PDF", 400
-    response = send_file(file_path, mimetype='application/pdf', as_attachment=False)
-    response.headers['Content-Disposition'] = 'inline; filename="' + filename + '"'
-    response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
-    response.headers['Pragma'] = 'no-cache'
-    response.headers['Expires'] = '0'
-    return response
+    return send_upload(ref, mimetype='application/pdf')
 
 @app.route("/view_pdf_page/<path:filename>")
 def view_pdf_page(filename):
     """عرض صفحة مخصصة لملف PDF"""
-    # لو الملف موجود في قاعدة البيانات نسمح بعرض الصفحة أيضاً
-    doc = Document.query.filter_by(file_path=filename).first()
-    if doc and doc.file_bytes:
-        if not (doc.file_name or filename).lower().endswith('.pdf'):
-            return "هذا الملف ليس PDF", 400
-        return render_template("view_pdf.html", filename=filename)
-    
-    # fallback للقرص
-    file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-    if not os.path.exists(file_path):
+    ref = resolve_upload(filename)
+    if ref is None:
         return "الملف غير موجود", 404
-    if not filename.lower().endswith('.pdf'):
+    if not ref.name.lower().endswith('.pdf'):
         return "هذا الملف ليس PDF", 400
     return render_template("view_pdf.html", filename=filename)
 
 @app.route("/download_pdf/<path:filename>")
 def download_pdf(filename):
     """تحميل ملف PDF"""
-    doc = Document.query.filter_by(file_path=filename).first()
-    if doc and doc.file_bytes:
-        import io
-        return send_file(io.BytesIO(doc.file_bytes), mimetype='application/pdf', as_attachment=True, download_name=doc.file_name or filename)
-    
-    file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-    if not os.path.exists(file_path):
+    ref = resolve_upload(filename)
+    if ref is None:
         return "الملف غير موجود", 404
-    if not filename.lower().endswith('.pdf'):
+    if not ref.name.lower().endswith('.pdf'):
         return "هذا الملف ليس PDF", 400
-    return send_file(file_path, mimetype='application/pdf', as_attachment=True, download_name=filename)
+    return send_upload(ref, mimetype='application/pdf', as_attachment=True)
 
 @app.route("/document/<int:doc_id>/view")
 def view_document_by_id(doc_id: int):
     """عرض ملف المخزن في قاعدة البيانات مباشرةً باستخدام معرّف الوثيقة"""
-    doc = Document.query.get_or_404(doc_id)
-    if not doc.file_bytes:
-        return "لا يوجد ملف مرفوع لهذه الوثيقة", 404
-    import io
-    mime = doc.file_mime or 'application/octet-stream'
-    response = send_file(io.BytesIO(doc.file_bytes), mimetype=mime, as_attachment=False, download_name=doc.file_name or f"document_{doc.id}")
-    response.headers['Content-Disposition'] = 'inline; filename="' + (doc.file_name or f"document_{doc.id}") + '"'
-    return response
+    doc = Document.query.options(db.undefer(Document.file_bytes)).get_or_404(doc_id)
+    return send_document_file(doc)
 
 @app.route("/document/<int:doc_id>/download")
 def download_document_by_id(doc_id: int):
     """تحميل ملف المخزن في قاعدة البيانات مباشرةً باستخدام معرّف الوثيقة"""
-    doc = Document.query.get_or_404(doc_id)
-    if not doc.file_bytes:
-        return "لا يوجد ملف مرفوع لهذه الوثيقة", 404
-    import io
-    mime = doc.file_mime or 'application/octet-stream'
-    return send_file(io.BytesIO(doc.file_bytes), mimetype=mime, as_attachment=True, download_name=doc.file_name or f"document_{doc.id}")
+    doc = Document.query.options(db.undefer(Document.file_bytes)).get_or_404(doc_id)
+    return send_document_file(doc, as_attachment=True)
 
 @app.route("/view_image/<path:filename>")
 def view_image(filename):
     """عرض الصور في المتصفح مع واجهة محسنة"""
-    # من قاعدة البيانات أولاً
-    doc = Document.query.filter_by(file_path=filename).first()
-    if doc and doc.file_bytes:
-        import io
-        image_extensions = ['.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp']
-        fname = (doc.file_name or filename).lower()
-        if not any(fname.endswith(ext) for ext in image_extensions):
-            return "هذا الملف ليس صورة", 400
-        mime_type = doc.file_mime or 'application/octet-stream'
-        response = send_file(io.BytesIO(doc.file_bytes), mimetype=mime_type, as_attachment=False, download_name=doc.file_name or filename)
-        response.headers['Content-Disposition'] = 'inline; filename="' + (doc.file_name or filename) + '"'
-        response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
-        response.headers['Pragma'] = 'no-cache'
-        response.headers['Expires'] = '0'
-        return response
-    
-    # fallback للقرص
-    file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-    if not os.path.exists(file_path):
+    ref = resolve_upload(filename)
+    if ref is None:
         return "الملف غير موجود", 404
-    image_extensions = ['.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp']
-    if not any(filename.lower().endswith(ext) for ext in image_extensions):
+    image_extensions = ('.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp')
+    if not ref.name.lower().endswith(image_extensions):
         return "هذا الملف ليس صورة", 400
-    import mimetypes
-    mime_type, _ = mimetypes.guess_type(file_path)
-    response = send_file(file_path, mimetype=mime_type, as_attachment=False)
-    response.headers['Content-Disposition'] = 'inline; filename="' + filename + '"'
-    response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
-    response.headers['Pragma'] = 'no-cache'
-    response.headers['Expires'] = '0'
-    return response
+    return send_upload(ref)
 
 @app.route("/view_document/<path:filename>")
 def view_document(filename):
     """عرض ملفات Word و Excel في المتصفح مع واجهة محسنة"""
-    # من قاعدة البيانات أولاً
-    doc = Document.query.filter_by(file_path=filename).first()
-    if doc and doc.file_bytes:
-        import io
-        word_extensions = ['.doc', '.docx']
-        excel_extensions = ['.xls', '.xlsx']
-        fname = (doc.file_name or filename).lower()
-        if fname.endswith(tuple(word_extensions)):
-            mime_type = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
-        elif fname.endswith(tuple(excel_extensions)):
-            mime_type = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-        else:
-            return "نوع الملف غير مدعوم", 400
-        response = send_file(io.BytesIO(doc.file_bytes), mimetype=mime_type, as_attachment=False, download_name=doc.file_name or filename)
-        response.headers['Content-Disposition'] = 'inline; filename="' + (doc.file_name or filename) + '"'
-        response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
-        response.headers['Pragma'] = 'no-cache'
-        response.headers['Expires'] = '0'
-        return response
-    
-    # fallback للقرص
-    file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-    if not os.path.exists(file_path):
+    ref = resolve_upload(filename)
+    if ref is None:
         return "الملف غير موجود", 404
-    word_extensions = ['.doc', '.docx']
-    excel_extensions = ['.xls', '.xlsx']
-    if filename.lower().endswith(tuple(word_extensions)):
+    fname = ref.name.lower()
+    if fname.endswith(('.doc', '.docx')):
         mime_type = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
-        file_type = 'Word'
-    elif filename.lower().endswith(tuple(excel_extensions)):
+    elif fname.endswith(('.xls', '.xlsx')):
         mime_type = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-        file_type = 'Excel'
     else:
         return "نوع الملف غير مدعوم", 400
-    response = send_file(file_path, mimetype=mime_type, as_attachment=False)
-    response.headers['Content-Disposition'] = 'inline; filename="' + filename + '"'
-    response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
-    response.headers['Pragma'] = 'no-cache'
-    response.headers['Expires'] = '0'
-    return response
+    return send_upload(ref, mimetype=mime_type)
 
 @app.route("/client/<int:client_id>/add_custom_document", methods=["POST"])
 def add_custom_document(client_id):
@@ -1978,6 +2755,7 @@ def add_custom_document(client_id):
     )
     
     db.session.add(new_doc)
+    refresh_client_attention([client_id])
     db.session.commit()
     
     doc_type = "إجبارية" if is_required else "اختيارية"
@@ -2053,7 +2831,7 @@ def delete_custom_document(client_id, doc_id):
         return redirect(url_for("client_detail", client_id=client_id))
     
     # حذف الملف الفعلي إذا كان موجوداً على القرص
-    if doc.file_path:
+    if doc.file_path and app.config['LEGACY_DISK_FALLBACK']:
         try:
             file_path = os.path.join(app.config['UPLOAD_FOLDER'], doc.file_path)
             if os.path.exists(file_path):
@@ -2062,6 +2840,8 @@ def delete_custom_document(client_id, doc_id):
             flash(f"خطأ في حذف الملف: {str(e)}", "danger")
             return redirect(url_for("client_detail", client_id=client_id))
     # تنظيف الحقول المخزنة في قاعدة البيانات
+    release_blob(doc.blob_hash)
+    doc.blob_hash = None
     doc.file_bytes = None
     doc.file_name = None
     doc.file_mime = None
@@ -2069,6 +2849,7 @@ def delete_custom_document(client_id, doc_id):
     
     # حذف الوثيقة من قاعدة البيانات
     db.session.delete(doc)
+    refresh_client_attention([client_id])
     db.session.commit()
     
     flash(f"تم حذف الوثيقة '{doc.name}' بنجاح.", "success")
@@ -2080,7 +2861,7 @@ def delete_document(client_id, doc_id):
     doc = Document.query.filter_by(id=doc_id, client_id=client_id).first_or_404()
     
     # حذف الملف الفعلي من المجلد إن وُجد
-    if doc.file_path:
+    if doc.file_path and app.config['LEGACY_DISK_FALLBACK']:
         try:
             file_path = os.path.join(app.config['UPLOAD_FOLDER'], doc.file_path)
             if os.path.exists(file_path):
@@ -2092,12 +2873,15 @@ def delete_document(client_id, doc_id):
     # تحديث قاعدة البيانات
     # تنظيف حقول الملف
     doc.file_path = None
+    release_blob(doc.blob_hash)
+    doc.blob_hash = None
     doc.file_bytes = None
     doc.file_name = None
     doc.file_mime = None
     doc.file_size = None
     doc.status = "ناقصة"
     doc.uploaded_at = None
+    refresh_client_attention([client_id])
     db.session.commit()
     
     flash("تم حذف الملف وتحديث الحالة.", "success")
@@ -2108,65 +2892,65 @@ def download_all_documents(client_id):
     client = Client.query.get_or_404(client_id)
     
     # البحث عن جميع المستندات المرفوعة (في قاعدة البيانات أو على القرص)
-    uploaded_docs = [d for d in client.documents if (d.file_bytes is not None and len(d.file_bytes) > 0) or d.file_path]
+    uploaded_docs = Document.query.filter(Document.client_id == client.id, Document.has_file).all()
     
     if not uploaded_docs:
         flash("لا توجد ملفات مرفوعة للتنزيل.", "warning")
         return redirect(url_for("client_detail", client_id=client_id))
     
-    try:
-        import zipfile
-        import io
-        
-        # إنشاء ملف ZIP في الذاكرة
-        zip_buffer = io.BytesIO()
-        
-        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-            for doc in uploaded_docs:
-                # لو المخزن في قاعدة البيانات
-                if doc.file_bytes and len(doc.file_bytes) > 0:
-                    # استخدام اسم الملف الأصلي أو إنشاء اسم مناسب
-                    if doc.file_name:
-                        # إضافة امتداد الملف إذا لم يكن موجوداً
-                        file_name = doc.file_name
-                        if not '.' in file_name and doc.file_mime:
-                            if 'pdf' in doc.file_mime:
-                                file_name += '.pdf'
-                            elif 'image' in doc.file_mime:
-                                file_name += '.jpg'
-                    else:
-                        file_name = f"{doc.name}.pdf"  # افتراضي
-                    
-                    # تنظيف اسم الملف
-                    safe_name = secure_filename(file_name)
-                    if not safe_name:
-                        safe_name = f"{doc.name}_{doc.id}.pdf"
-                    
-                    zip_file.writestr(safe_name, doc.file_bytes)
+    def zip_entries():
+        used_names = set()
+        for doc in uploaded_docs:
+            # لو المخزن في قاعدة البيانات
+            if doc.has_db_file:
+                # استخدام اسم الملف الأصلي أو إنشاء اسم مناسب
+                if doc.file_name:
+                    # إضافة امتداد الملف إذا لم يكن موجوداً
+                    file_name = doc.file_name
+                    if not '.' in file_name and doc.file_mime:
+                        if 'pdf' in doc.file_mime:
+                            file_name += '.pdf'
+                        elif 'image' in doc.file_mime:
+                            file_name += '.jpg'
                 else:
-                    # fallback للقرص
-                    if doc.file_path:
-                        file_path = os.path.join(app.config['UPLOAD_FOLDER'], doc.file_path)
-                        if os.path.exists(file_path):
-                            zip_filename = f"{doc.name}_{os.path.basename(doc.file_path)}"
-                            zip_file.write(file_path, zip_filename)
-        
-        # إعادة تعيين المؤشر لبداية الملف
-        zip_buffer.seek(0)
-        
-        # إنشاء اسم ملف ZIP
-        zip_filename = f"{client.name}_ملفات_مرفوعة_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip"
-        
-        return send_file(
-            zip_buffer,
-            mimetype='application/zip',
-            as_attachment=True,
-            download_name=zip_filename
-        )
-        
-    except Exception as e:
-        flash(f"خطأ في إنشاء ملف ZIP: {str(e)}", "danger")
-        return redirect(url_for("client_detail", client_id=client_id))
+                    file_name = f"{doc.name}.pdf"  # افتراضي
+                
+                # تنظيف اسم الملف
+                zip_name = secure_filename(file_name)
+                if not zip_name:
+                    zip_name = f"{doc.name}_{doc.id}.pdf"
+                # القراءة تتم أثناء إرسال الاستجابة في جلسة جديدة، لذلك تُجلب الوثيقة بالمعرّف
+                opener = lambda doc_id=doc.id: open_stored_document(doc_id)
+            elif app.config['LEGACY_DISK_FALLBACK']:
+                # fallback للقرص
+                file_path = os.path.join(app.config['UPLOAD_FOLDER'], doc.file_path)
+                if not os.path.exists(file_path):
+                    continue
+                zip_name = f"{doc.name}_{os.path.basename(doc.file_path)}"
+                opener = lambda file_path=file_path: open(file_path, 'rb')
+            else:
+                continue
+            
+            # منع تكرار الأسماء داخل الأرشيف
+            if zip_name in used_names:
+                stem, ext = os.path.splitext(zip_name)
+                zip_name = f"{stem}_{doc.id}{ext}"
+            used_names.add(zip_name)
+            
+            yield zip_name, opener
+            # محتوى الوثائق القديمة المخزن في العمود لا يبقى في الذاكرة بعد إضافته
+            db.session.expunge_all()
+    
+    # إنشاء اسم ملف ZIP
+    zip_filename = f"{client.name}_ملفات_مرفوعة_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip"
+    
+    # الأرشيف يُرسل على أجزاء أثناء كتابته (بدون تجميعه في الذاكرة)
+    from urllib.parse import quote
+    response = Response(stream_with_context(stream_zip(zip_entries())), mimetype='application/zip')
+    response.headers['Content-Disposition'] = (
+        f"attachment; filename=\"client_{client.id}_documents.zip\"; filename*=UTF-8''{quote(zip_filename)}"
+    )
+    return response
 
 # -------- متابعات --------
 @app.route("/client/<int:client_id>/add_followup", methods=["POST"])
@@ -2213,6 +2997,7 @@ def update_client_status(client_id):
         client.rejection_reason = None  # مسح رقم المرة عند تغيير الحالة
     
     db.session.commit()
+    invalidate_client_stats()
     
     if new_status == "رفع مرة أخرى":
         flash(f"تم تحديث حالة العميل {client.name} إلى '{new_status}' للمرة رقم {rejection_reason}.", "success")
@@ -2224,34 +3009,16 @@ def update_client_status(client_id):
 @app.route("/clients_needing_attention")
 def clients_needing_attention():
     """عرض جميع العملاء المحتاجين متابعة"""
-    # الحصول على جميع العملاء
-    all_clients = Client.query.all()
-    
-    # تصفية العملاء المحتاجين متابعة
     clients_needing_attention = []
     
-    for client in all_clients:
-        missing_docs = 0
-        overdue_payments = 0
-        
-        # حساب الأوراق الناقصة
-        for doc in client.documents:
-            if doc.status == "ناقصة" and doc.required:
-                missing_docs += 1
-        
-        # حساب الدفعات المتأخرة
-        for payment in client.payments:
-            if not payment.is_paid and payment.next_due_date and payment.next_due_date < date.today():
-                overdue_payments += 1
-        
-        # إضافة العميل إذا كان يحتاج متابعة
-        if missing_docs > 0 or overdue_payments > 0:
-            client.missing_docs = missing_docs
-            client.overdue_payments = overdue_payments
-            clients_needing_attention.append(client)
-    
     # ترتيب العملاء حسب الأولوية (الأوراق الناقصة أولاً، ثم الدفعات المتأخرة)
-    clients_needing_attention.sort(key=lambda x: (x.missing_docs, x.overdue_payments), reverse=True)
+    refresh_stale_attention(date.today())
+    for client, summary in clients_attention_query(date.today()).order_by(
+        ClientAttention.missing_required_docs.desc(), ClientAttention.overdue_payments.desc()
+    ):
+        client.missing_docs = summary.missing_required_docs
+        client.overdue_payments = summary.overdue_payments
+        clients_needing_attention.append(client)
     
     return render_template("clients_needing_attention.html", 
                          clients=clients_needing_attention,
@@ -2270,12 +3037,7 @@ def all_clients():
     
     # تطبيق فلتر البحث
     if search_query:
-        query = query.filter(
-            db.or_(
-                Client.name.contains(search_query),
-                Client.phone.contains(search_query)
-            )
-        )
+        query = query.filter(Client.id.in_(search_entity_ids(search_query, 'client')))
     
     # تطبيق فلتر الحالة
     if status_filter:
@@ -2285,18 +3047,18 @@ def all_clients():
     if visa_type_filter:
         query = query.filter(Client.visa_type == visa_type_filter)
     
-    # ترتيب النتائج
-    clients = query.order_by(Client.created_at.desc()).all()
-    
-    # حساب الإحصائيات
-    total_clients = len(clients)
-    status_counts = {
-        'جاري': len([c for c in clients if c.status == 'جاري']),
-        'مكتمل': len([c for c in clients if c.status == 'مكتمل']),
-        'مرفوض': len([c for c in clients if c.status == 'مرفوض']),
-        'رفع مرة أخرى': len([c for c in clients if c.status == 'رفع مرة أخرى']),
-        'لغا المعاملة': len([c for c in clients if c.status == 'لغا المعاملة'])
-    }
+    # النتائج صفحة صفحة (الأحدث أولاً)
+    page = keyset_paginate(query, Client)
+    clients = page.items
+    
+    # حساب الإحصائيات: بدون فلاتر من كاش الإحصائيات، ومع الفلاتر استعلام GROUP BY واحد
+    if search_query or status_filter or visa_type_filter:
+        status_counts = count_by_status(query)
+        total_clients = sum(status_counts.values())
+    else:
+        stats = client_stats()
+        status_counts = stats['by_status']
+        total_clients = stats['total']
     
     # الحصول على أنواع التأشيرات الفريدة
     visa_types = db.session.query(Client.visa_type).distinct().all()
@@ -2304,6 +3066,7 @@ def all_clients():
     
     return render_template("all_clients.html", 
                          clients=clients,
+                         page=page,
                          total_clients=total_clients,
                          status_counts=status_counts,
                          visa_types=visa_types,
@@ -2317,56 +3080,37 @@ def manage_status():
     # عرض العملاء حسب الحالة
     status_filter = request.args.get('status', '')
     clients = []
+    page = None
+    total_clients = 0
     
-    if status_filter:
-        if status_filter == "مكتمل":
-            clients = Client.query.filter_by(status="مكتمل").order_by(Client.created_at.desc()).all()
-        elif status_filter == "جاري":
-            clients = Client.query.filter_by(status="جاري").order_by(Client.created_at.desc()).all()
-        elif status_filter == "مرفوض":
-            clients = Client.query.filter_by(status="مرفوض").order_by(Client.created_at.desc()).all()
-        elif status_filter == "رفع مرة أخرى":
-            clients = Client.query.filter_by(status="رفع مرة أخرى").order_by(Client.created_at.desc()).all()
-        elif status_filter == "لغا المعاملة":
-            clients = Client.query.filter_by(status="لغا المعاملة").order_by(Client.created_at.desc()).all()
-    
-    return render_template("manage_status.html", clients=clients, status_filter=status_filter)
+    if status_filter in CLIENT_STATUSES:
+        page = keyset_paginate(Client.query.filter_by(status=status_filter), Client)
+        clients = page.items
+        total_clients = client_stats()['by_status'][status_filter]
+    
+    return render_template("manage_status.html", clients=clients, page=page,
+                         total_clients=total_clients, status_filter=status_filter)
 
 # -------- تحديث الأوراق للعملاء الموجودين --------
 def update_existing_clients_documents():
-    """تحديث الأوراق للعملاء الموجودين بإضافة الأوراق الجديدة"""
-    clients = Client.query.all()
-    updated_count = 0
-    
-    for client in clients:
-        # الحصول على أسماء الأوراق الموجودة بالفعل
-        existing_doc_names = [d.name for d in client.documents]
-        
-        # إضافة الأوراق الجديدة التي لم تكن موجودة
-        for doc_name in DOCS_REQUIRED:
-            if doc_name not in existing_doc_names:
-                new_doc = Document(
-                    client_id=client.id,
-                    name=doc_name,
-                    required=True,
-                    status="ناقصة"
-                )
-                db.session.add(new_doc)
-                updated_count += 1
-        
-        # إضافة الأوراق الاختيارية الجديدة
-        for doc_name in DOCS_OPTIONAL:
-            if doc_name not in existing_doc_names:
-                new_doc = Document(
-                    client_id=client.id,
-                    name=doc_name,
-                    required=False,
-                    status="ناقصة"
-                )
-                db.session.add(new_doc)
-                updated_count += 1
-    
+    """إضافة الأوراق الافتراضية الناقصة لكل العملاء في INSERT ... SELECT واحد، ويرجع عدد الأوراق المضافة"""
+    defaults = db.union_all(*[
+        db.select(db.literal(name, db.String).label('name'), db.literal(required).label('required'))
+        for names, required in ((DOCS_REQUIRED, True), (DOCS_OPTIONAL, False))
+        for name in names
+    ]).subquery('default_document')
+    # العميل × الأوراق الافتراضية، عدا الموجود بنفس الاسم (ux_document_client_id_name)
+    missing = db.select(Client.id, defaults.c.name, defaults.c.required, db.literal("ناقصة")).join(
+        defaults, db.true()
+    ).where(
+        ~db.exists().where(Document.client_id == Client.id, Document.name == defaults.c.name)
+    )
+    updated_count = db.session.execute(
+        db.insert(Document).from_select(['client_id', 'name', 'required', 'status'], missing)
+    ).rowcount
     if updated_count > 0:
+        refresh_client_attention()
+        bump_versions(db.session, ['document', 'client_attention'])
         db.session.commit()
         return updated_count
     return 0
@@ -2473,6 +3217,18 @@ def setup_admin():
     return redirect(url_for("choose_section"))
 
 # -------- تحديث قاعدة البيانات --------
+# فهارس ترتيب القوائم (نفس __table_args__ في النماذج) لقواعد البيانات الموجودة مسبقاً
+LIST_INDEXES = (
+    ('ix_user_created_at_id', 'user', 'created_at, id'),
+    ('ix_client_created_at_id', 'client', 'created_at, id'),
+    ('ix_client_status_created_at_id', 'client', 'status, created_at, id'),
+    ('ix_disappointed_client_created_at_id', 'disappointed_client', 'created_at, id'),
+    ('ix_client_followup_created_at_id', 'client_followup', 'created_at, id'),
+    ('ix_legal_case_created_at_id', 'legal_case', 'created_at, id'),
+    ('ix_fully_completed_client_created_at_id', 'fully_completed_client', 'created_at, id'),
+    ('ix_refund_payment_created_at_id', 'refund_payment', 'created_at, id'),
+)
+
 def migrate_database():
     """تحديث قاعدة البيانات لإضافة الأعمدة الجديدة"""
     try:
@@ -2521,6 +3277,12 @@ def migrate_database():
                         ) THEN
                             ALTER TABLE document ADD COLUMN file_size INTEGER;
                         END IF;
+                        IF NOT EXISTS (
+                            SELECT 1 FROM information_schema.columns 
+                            WHERE table_name='document' AND column_name='blob_hash'
+                        ) THEN
+                            ALTER TABLE document ADD COLUMN blob_hash VARCHAR(64) REFERENCES blob(hash);
+                        END IF;
                         
                         -- إضافة أعمدة المواعيد لجدول document
                         IF NOT EXISTS (
@@ -2558,6 +3320,28 @@ def migrate_database():
                             ALTER TABLE client ADD COLUMN rejection_reason VARCHAR(50);
                         END IF;
                         
+                        -- إضافة عمود paid_total لجدول client مع حسابه من الدفعات الموجودة
+                        IF NOT EXISTS (
+                            SELECT 1 FROM information_schema.columns 
+                            WHERE table_name='client' AND column_name='paid_total'
+                        ) THEN
+                            ALTER TABLE client ADD COLUMN paid_total INTEGER NOT NULL DEFAULT 0;
+                            UPDATE client SET paid_total = COALESCE(
+                                (SELECT SUM(amount) FROM payment WHERE payment.client_id = client.id AND payment.is_paid), 0
+                            );
+                        END IF;
+                        
+                        -- أعمدة الهاتف الموحد في فهرس البحث
+                        IF EXISTS (
+                            SELECT 1 FROM information_schema.tables WHERE table_name='search_entry'
+                        ) AND NOT EXISTS (
+                            SELECT 1 FROM information_schema.columns 
+                            WHERE table_name='search_entry' AND column_name='phone_digits'
+                        ) THEN
+                            ALTER TABLE search_entry ADD COLUMN phone_digits VARCHAR(20);
+                            ALTER TABLE search_entry ADD COLUMN phone_reversed VARCHAR(20);
+                        END IF;
+                        
                         -- إضافة عمود client_id لجدول client_followup
                         IF NOT EXISTS (
                             SELECT 1 FROM information_schema.columns 
@@ -2567,6 +3351,15 @@ def migrate_database():
                         END IF;
                     END $$;
                 """))
+                conn.execute(text("CREATE INDEX IF NOT EXISTS ix_document_blob_hash ON document (blob_hash)"))
+                conn.execute(text("CREATE INDEX IF NOT EXISTS ix_document_file_path ON document (file_path)"))
+                conn.execute(text("CREATE INDEX IF NOT EXISTS ix_document_client_id ON document (client_id)"))
+                conn.execute(text("CREATE INDEX IF NOT EXISTS ix_payment_client_id ON payment (client_id)"))
+                conn.execute(text("CREATE INDEX IF NOT EXISTS ix_payment_next_due_date ON payment (next_due_date)"))
+                conn.execute(text("CREATE INDEX IF NOT EXISTS ix_search_entry_phone_digits ON search_entry (phone_digits)"))
+                conn.execute(text("CREATE INDEX IF NOT EXISTS ix_search_entry_phone_reversed ON search_entry (phone_reversed)"))
+                for name, table, columns in LIST_INDEXES:
+                    conn.execute(text(f'CREATE INDEX IF NOT EXISTS {name} ON "{table}" ({columns})'))
             return
         
         # التحقق من وجود عمود payment_type في جدول payment
@@ -2589,6 +3382,14 @@ def migrate_database():
             db.session.execute(text("ALTER TABLE client ADD COLUMN rejection_reason VARCHAR(50)"))
             print("✅ تم إضافة عمود rejection_reason")
         
+        if 'paid_total' not in columns:
+            db.session.execute(text("ALTER TABLE client ADD COLUMN paid_total INTEGER NOT NULL DEFAULT 0"))
+            db.session.execute(text(
+                "UPDATE client SET paid_total = COALESCE("
+                "(SELECT SUM(amount) FROM payment WHERE payment.client_id = client.id AND payment.is_paid = 1), 0)"
+            ))
+            print("✅ تم إضافة عمود paid_total")
+        
         # التحقق من وجود أعمدة المواعيد في جدول document
         result = db.session.execute(text("PRAGMA table_info(document)"))
         columns = [row[1] for row in result.fetchall()]
@@ -2605,6 +3406,28 @@ def migrate_database():
             db.session.execute(text("ALTER TABLE document ADD COLUMN deadline_warning_days INTEGER DEFAULT 7"))
             print("✅ تم إضافة عمود deadline_warning_days")
         
+        # بصمة المحتوى في مخزن الملفات
+        if 'blob_hash' not in columns:
+            db.session.execute(text("ALTER TABLE document ADD COLUMN blob_hash VARCHAR(64) REFERENCES blob(hash)"))
+            print("✅ تم إضافة عمود blob_hash")
+        db.session.execute(text("CREATE INDEX IF NOT EXISTS ix_document_blob_hash ON document (blob_hash)"))
+        db.session.execute(text("CREATE INDEX IF NOT EXISTS ix_document_file_path ON document (file_path)"))
+        db.session.execute(text("CREATE INDEX IF NOT EXISTS ix_document_client_id ON document (client_id)"))
+        db.session.execute(text("CREATE INDEX IF NOT EXISTS ix_payment_client_id ON payment (client_id)"))
+        db.session.execute(text("CREATE INDEX IF NOT EXISTS ix_payment_next_due_date ON payment (next_due_date)"))
+        for name, table, columns in LIST_INDEXES:
+            db.session.execute(text(f'CREATE INDEX IF NOT EXISTS {name} ON "{table}" ({columns})'))
+        
+        # أعمدة الهاتف الموحد في فهرس البحث (تُملأ عند إعادة بناء الفهرس في init_db)
+        result = db.session.execute(text("PRAGMA table_info(search_entry)"))
+        columns = [row[1] for row in result.fetchall()]
+        if 'phone_digits' not in columns:
+            db.session.execute(text("ALTER TABLE search_entry ADD COLUMN phone_digits VARCHAR(20)"))
+            db.session.execute(text("ALTER TABLE search_entry ADD COLUMN phone_reversed VARCHAR(20)"))
+            print("✅ تم إضافة أعمدة الهاتف الموحد لجدول search_entry")
+        db.session.execute(text("CREATE INDEX IF NOT EXISTS ix_search_entry_phone_digits ON search_entry (phone_digits)"))
+        db.session.execute(text("CREATE INDEX IF NOT EXISTS ix_search_entry_phone_reversed ON search_entry (phone_reversed)"))
+        
         # التحقق من وجود عمود client_id في جدول client_followup
         result = db.session.execute(text("PRAGMA table_info(client_followup)"))
         columns = [row[1] for row in result.fetchall()]
@@ -2633,27 +3456,94 @@ def migrate_database():
     except Exception as e:
         print(f"❌ خطأ في تحديث قاعدة البيانات: {e}")
         db.session.rollback()
+        raise
 
 # -------- تهيئة قاعدة البيانات --------
-def init_db():
-    db.create_all()
-    # تحديث قاعدة البيانات
-    migrate_database()
+def backfill_client_attention():
+    """ملء ملخص المتابعة لأول مرة بعد إنشاء الجدول"""
+    if Client.query.first() is not None and ClientAttention.query.first() is None:
+        refresh_client_attention()
+
+def create_search_index():
+    app.config['SEARCH_BACKEND'] = setup_search_index()
+
+def unique_document_names():
+    """يحذف نسخ الوثيقة المكررة بنفس الاسم للعميل (الفارغة) ويعيد تسمية المكررة بملفات ثم ينشئ الفهرس الفريد"""
+    from sqlalchemy import text
+    has_file = "{0}.blob_hash IS NOT NULL OR {0}.file_bytes IS NOT NULL OR {0}.file_path IS NOT NULL"
+    # تبقى النسخة التي فيها ملف، وإلا الأقدم
+    deleted = db.session.execute(text(f"""
+        DELETE FROM document WHERE id IN (
+            SELECT d.id FROM document d
+            WHERE NOT ({has_file.format('d')}) AND EXISTS (
+                SELECT 1 FROM document k
+                WHERE k.client_id = d.client_id AND k.name = d.name AND k.id <> d.id
+                  AND ({has_file.format('k')} OR k.id < d.id)
+            )
+        )
+    """)).rowcount
+    if deleted:
+        print(f"✅ تم حذف {deleted} وثيقة مكررة بدون ملف")
+    # نسختان أو أكثر بملفات لنفس الاسم: تبقى الأقدم باسمها ويُضاف رقم الوثيقة لاسم الباقي
+    duplicate = "EXISTS (SELECT 1 FROM document k WHERE k.client_id = d.client_id AND k.name = d.name AND k.id < d.id)"
+    renamed = db.session.execute(text(f"SELECT d.id, d.client_id FROM document d WHERE {duplicate}")).all()
+    if renamed:
+        db.session.execute(text(f"""
+            UPDATE document SET name = substr(name, 1, 100) || ' (' || id || ')'
+            WHERE id IN (SELECT d.id FROM document d WHERE {duplicate})
+        """))
+        clients = sorted({client_id for _, client_id in renamed})
+        print(f"⚠️ تمت إعادة تسمية {len(renamed)} وثيقة مكررة بملفات - راجع العملاء: {', '.join(map(str, clients))}")
+    db.session.execute(text(
+        "CREATE UNIQUE INDEX IF NOT EXISTS ux_document_client_id_name ON document (client_id, name)"
+    ))
+
+# الترقيات بالترتيب - الترقية الجديدة تُضاف في آخر القائمة برقم أكبر ولا تُعدل الترقيات المسجلة
+MIGRATIONS = [
+    Migration(1, 'إنشاء الجداول', db.create_all),
+    Migration(2, 'الأعمدة والفهارس الإضافية', migrate_database),
+    Migration(3, 'ملخص متابعة العملاء', backfill_client_attention),
+    Migration(4, 'فهرس البحث النصي', create_search_index),
+    Migration(5, 'فهرس فريد لأسماء وثائق العميل', unique_document_names),
+]
 
-# Initialize database on first request
+def init_db():
+    """ترقية قاعدة البيانات (migrate.py مع كل نشر): الترقيات الجديدة ثم البيانات التي تتبع الكود"""
+    applied = run_migrations(db, MIGRATIONS)
+    # صف إصدار لكل جدول جديد في النماذج
+    ensure_table_versions()
+    # فهرس البحث مبني بتجهيز نص مختلف (تعديل search_text.py)
+    if search_index_is_stale():
+        rebuild_search_index()
+        db.session.commit()
+    # الأوراق المضافة حديثاً إلى DOCS_REQUIRED/DOCS_OPTIONAL
+    documents_added = update_existing_clients_documents()
+    return applied, documents_added
+
+def schema_is_current() -> bool:
+    """كل الترقيات مسجلة في schema_version (استعلام واحد، بدون أي تعديل)"""
+    return current_version(db.engine) == max(m.version for m in MIGRATIONS)
+
+def warm_up_templates() -> int:
+    """يترجم (أو يقرأ من كاش القرص) كل قوالب templates/ حتى لا يدفع أول طلب لكل صفحة تكلفة الترجمة"""
+    names = [name for name in app.jinja_env.list_templates() if name.endswith('.html')]
+    for name in names:
+        app.jinja_env.get_template(name)
+    return len(names)
+
+# الترقيات لا تُنفذ عند تشغيل الـ workers - فقط تنبيه إذا لم يُشغل migrate.py
 with app.app_context():
-    init_db()
-    # تحديث قاعدة البيانات لإضافة الأعمدة الجديدة
+    if not schema_is_current():
+        print("⚠️ قاعدة البيانات تحتاج ترقية - شغّل: python migrate.py")
+
+if app.config['TEMPLATE_WARMUP']:
     try:
-        migrate_database()
+        warm_up_templates()
     except Exception as e:
-        print(f"خطأ في الترقية التلقائية: {e}")
-    
-    # تحديث الأوراق للعملاء الموجودين تلقائياً
-    try:
-        update_existing_clients_documents()
-    except:
-        pass  # تجاهل الأخطاء في حالة عدم وجود عملاء بعد
+        print(f"⚠️ خطأ في ترجمة القوالب مسبقاً: {e}")
 
 if __name__ == "__main__":
+    # التشغيل المحلي: ترقية قاعدة البيانات قبل البدء
+    with app.app_context():
+        init_db()
     app.run(debug=True)
@@ -0,0 +1,178 @@
+"""
+مخزن محتوى الملفات المرفوعة بالبصمة (SHA-256)
+
+كل محتوى يُخزن مرة واحدة فقط مهما تكرر رفعه، والوثيقة تحتفظ بالبصمة فقط.
+يوجد مخزنان: القرص (مجلدات مقسمة داخل UPLOAD_FOLDER) وقاعدة البيانات (أجزاء bytea).
+كل المخازن تتعامل مع صف Blob نفسه حتى يمكن التبديل بينها بدون تغيير باقي الكود.
+النقل من وإلى المخزن يتم على أجزاء ثابتة الحجم، فالذاكرة المستخدمة لا تعتمد على حجم الملف.
+"""
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+
+from sqlalchemy import delete, insert, select
+
+# حجم الجزء عند القراءة والكتابة (وحجم صف blob_chunk في قاعدة البيانات)
+CHUNK_SIZE = 256 * 1024
+
+
+class BlobTooLarge(Exception):
+    """حجم الملف المرفوع أكبر من الحد المسموح"""
+
+
+def spool_stream(stream, tmp_dir: str, max_size: int = None, chunk_size: int = CHUNK_SIZE):
+    """
+    ينسخ الملف على أجزاء إلى ملف مؤقت مع حساب البصمة والحجم أثناء النسخ.
+    يرجع (البصمة، الحجم، مسار الملف المؤقت).
+    """
+    os.makedirs(tmp_dir, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+    fd, tmp_path = tempfile.mkstemp(dir=tmp_dir, prefix='.upload-')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            while True:
+                chunk = stream.read(chunk_size)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if max_size is not None and size > max_size:
+                    raise BlobTooLarge(size)
+                digest.update(chunk)
+                out.write(chunk)
+    except Exception:
+        os.remove(tmp_path)
+        raise
+    return digest.hexdigest(), size, tmp_path
+
+
+class LocalBlobBackend:
+    """تخزين المحتوى على القرص: root/ab/cd/<hash>"""
+    name = 'local'
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def path_for(self, blob_hash: str) -> str:
+        return os.path.join(self.root, blob_hash[:2], blob_hash[2:4], blob_hash)
+
+    def write_file(self, blob, tmp_path: str):
+        path = self.path_for(blob.hash)
+        if os.path.exists(path):
+            os.remove(tmp_path)  # نفس البصمة = نفس المحتوى
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # نقل الملف المؤقت كاملاً ثم إعادة التسمية حتى لا يُقرأ ملف نصف مكتوب
+        staged = path + '.part'
+        shutil.move(tmp_path, staged)
+        os.replace(staged, path)
+
+    def open(self, blob):
+        return open(self.path_for(blob.hash), 'rb')
+
+    def delete(self, blob_hash: str):
+        path = self.path_for(blob_hash)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+class DatabaseBlobBackend:
+    """تخزين المحتوى في جدول blob_chunk (Postgres bytea) على أجزاء بحجم CHUNK_SIZE"""
+    name = 'db'
+
+    def __init__(self, session, get_engine, chunk_table):
+        self.session = session
+        self.get_engine = get_engine
+        self.chunk_table = chunk_table
+
+    def write_file(self, blob, tmp_path: str):
+        # كل جزء يُرسل في INSERT مستقل داخل نفس المعاملة
+        try:
+            with open(tmp_path, 'rb') as f:
+                seq = 0
+                while True:
+                    chunk = f.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    self.session.execute(insert(self.chunk_table).values(blob_hash=blob.hash, seq=seq, data=chunk))
+                    seq += 1
+        finally:
+            os.remove(tmp_path)
+
+    def open(self, blob):
+        return DatabaseBlobReader(self.get_engine(), self.chunk_table, blob.hash, blob.size)
+
+    def delete(self, blob_hash: str):
+        # داخل معاملة المستدعي مثل write_file - الـ commit بعد حذف كل الملفات
+        self.session.execute(delete(self.chunk_table).where(self.chunk_table.c.blob_hash == blob_hash))
+
+
+class DatabaseBlobReader(io.RawIOBase):
+    """قارئ ملف فوق أجزاء blob_chunk: يجلب جزءاً واحداً فقط في كل مرة"""
+
+    def __init__(self, engine, chunk_table, blob_hash: str, size: int):
+        self.engine = engine
+        self.chunk_table = chunk_table
+        self.blob_hash = blob_hash
+        self.size = size
+        self.pos = 0
+        self._conn = None
+        self._seq = None
+        self._chunk = b''
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.pos
+        elif whence == io.SEEK_END:
+            offset += self.size
+        self.pos = max(0, offset)
+        return self.pos
+
+    def _load(self, seq):
+        if self._seq != seq:
+            # اتصال مستقل لأن القراءة قد تستمر بعد انتهاء جلسة الطلب (استجابة متدفقة)
+            if self._conn is None:
+                self._conn = self.engine.connect()
+            t = self.chunk_table
+            self._chunk = self._conn.execute(
+                select(t.c.data).where(t.c.blob_hash == self.blob_hash, t.c.seq == seq)
+            ).scalar() or b''
+            self._seq = seq
+        return self._chunk
+
+    def readinto(self, b):
+        if self.pos >= self.size:
+            return 0
+        seq, offset = divmod(self.pos, CHUNK_SIZE)
+        chunk = self._load(seq)
+        n = min(len(b), len(chunk) - offset)
+        if n <= 0:
+            return 0
+        b[:n] = chunk[offset:offset + n]
+        self.pos += n
+        return n
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+        super().close()
+
+
+def make_backends(upload_folder: str, session, get_engine, chunk_table) -> dict:
+    """المخازن المتاحة حسب الاسم المخزن في عمود blob.backend"""
+    return {
+        LocalBlobBackend.name: LocalBlobBackend(os.path.join(upload_folder, 'blobs')),
+        DatabaseBlobBackend.name: DatabaseBlobBackend(session, get_engine, chunk_table),
+    }
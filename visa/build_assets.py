@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+بناء ملفات الواجهة الثابتة (CSS/JS/الخطوط) محلياً بدل تحميلها من CDN في كل صفحة
+
+- ينزل Bootstrap RTL وFont Awesome وخط Cairo مرة واحدة إلى static/vendor (أو يقرأها منه إن وجدت)
+- يدمج CSS (Bootstrap + Font Awesome + Cairo + style.css) في ملف واحد مصغر
+- يحذف من Font Awesome الأيقونات غير المستخدمة في القوالب ويقص ملفات الخط عليها (يحتاج fonttools)
+- يحتفظ من خط Cairo بالحروف العربية واللاتينية فقط
+- يكتب الملفات في static/dist بأسماء فيها بصمة المحتوى + نسخة .gz، وخريطة الأسماء في manifest.json
+
+التطبيق يستخدم asset_url('app.css') في القوالب، وإذا لم يوجد manifest.json تُستخدم روابط CDN كما كانت.
+
+الاستخدام:
+    python build_assets.py [--refresh]
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import re
+import shutil
+import sys
+import urllib.request
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+STATIC_DIR = os.path.join(BASE_DIR, 'static')
+VENDOR_DIR = os.path.join(STATIC_DIR, 'vendor')
+DIST_DIR = os.path.join(STATIC_DIR, 'dist')
+TEMPLATES_DIR = os.path.join(BASE_DIR, 'templates')
+
+BOOTSTRAP = 'https://cdn.jsdelivr.net/npm/bootstrap@5.3.3/dist'
+FONT_AWESOME = 'https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.4.0'
+VENDOR_FILES = {
+    'bootstrap.rtl.min.css': f'{BOOTSTRAP}/css/bootstrap.rtl.min.css',
+    'bootstrap.bundle.min.js': f'{BOOTSTRAP}/js/bootstrap.bundle.min.js',
+    'fontawesome.min.css': f'{FONT_AWESOME}/css/all.min.css',
+    'fa-solid-900.woff2': f'{FONT_AWESOME}/webfonts/fa-solid-900.woff2',
+    'fa-regular-400.woff2': f'{FONT_AWESOME}/webfonts/fa-regular-400.woff2',
+    'fa-brands-400.woff2': f'{FONT_AWESOME}/webfonts/fa-brands-400.woff2',
+}
+CAIRO_CSS = 'https://fonts.googleapis.com/css2?family=Cairo:wght@300;400;500;600;700;800;900&display=swap'
+# Google Fonts يرجع woff2 فقط للمتصفحات الحديثة
+BROWSER_UA = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36'
+# أجزاء خط Cairo المطلوبة (الأسماء في تعليقات CSS من Google Fonts)
+CAIRO_SUBSETS = ('arabic', 'latin')
+
+FA_RULE = re.compile(r'((?:\.fa-[a-z0-9-]+:{1,2}(?:before|after),?)+)\{content:"\\([0-9a-f]+)"\}')
+FONT_FACE = re.compile(r'@font-face\s*\{[^}]*\}')
+
+
+def fetch(url, path, refresh=False):
+    if os.path.exists(path) and not refresh:
+        return
+    print(f"⬇️  {url}")
+    req = urllib.request.Request(url, headers={'User-Agent': BROWSER_UA})
+    with urllib.request.urlopen(req, timeout=60) as response, open(path + '.part', 'wb') as f:
+        shutil.copyfileobj(response, f)
+    os.replace(path + '.part', path)
+
+
+def read(path, mode='r'):
+    with open(path, mode, **({} if 'b' in mode else {'encoding': 'utf-8'})) as f:
+        return f.read()
+
+
+def fetch_vendor(refresh=False):
+    os.makedirs(VENDOR_DIR, exist_ok=True)
+    for name, url in VENDOR_FILES.items():
+        fetch(url, os.path.join(VENDOR_DIR, name), refresh)
+    # CSS خط Cairo يشير لملفات الخط بروابط مطلقة - تُنزل وتُستبدل بأسماء محلية
+    cairo_path = os.path.join(VENDOR_DIR, 'cairo.css')
+    fetch(CAIRO_CSS, cairo_path, refresh)
+    css = read(cairo_path)
+    for i, url in enumerate(dict.fromkeys(re.findall(r'url\((https://[^)]+)\)', css))):
+        local = f'cairo-{i}.woff2'
+        fetch(url, os.path.join(VENDOR_DIR, local), refresh)
+        css = css.replace(url, local)
+    with open(cairo_path, 'w', encoding='utf-8') as f:
+        f.write(css)
+
+
+def used_icon_classes():
+    """
+    كل fa-* تظهر في القوالب أو ملفات static (تشمل الأسماء المكتوبة داخل JavaScript)،
+    والأسماء بين علامات التنصيص في fa-{{ 'check-circle' if ... else 'clock' }}
+    """
+    names = set()
+    for root in (TEMPLATES_DIR, STATIC_DIR):
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames[:] = [d for d in dirnames if d not in ('vendor', 'dist')]
+            for filename in filenames:
+                if filename.endswith(('.html', '.js', '.css')):
+                    content = read(os.path.join(dirpath, filename))
+                    names.update(re.findall(r'fa-[a-z0-9-]+', content))
+                    for expression in re.findall(r'fa-\{\{(.*?)\}\}', content, flags=re.S):
+                        names.update('fa-' + name for name in re.findall(r'[\'"]([a-z0-9-]+)[\'"]', expression))
+    return names
+
+
+def prune_icons(css, used):
+    """يحذف قواعد الأيقونات غير المستخدمة ويرجع CSS الجديد والأكواد المستخدمة"""
+    codepoints = set()
+
+    def keep(match):
+        selectors = match.group(1).rstrip(',').split(',')
+        kept = [s for s in selectors if s.split(':')[0][1:] in used]
+        if not kept:
+            return ''
+        codepoints.add(int(match.group(2), 16))
+        return '%s{content:"\\%s"}' % (','.join(kept), match.group(2))
+
+    return FA_RULE.sub(keep, css), codepoints
+
+
+def subset_font(src, codepoints):
+    """ملف woff2 بالأيقونات المستخدمة فقط - أو الملف كما هو إذا لم تكن fonttools مثبتة"""
+    data = read(src, 'rb')
+    try:
+        from io import BytesIO
+        from fontTools import subset
+    except ImportError:
+        return data
+    options = subset.Options()
+    options.flavor = 'woff2'
+    options.layout_features = ['*']
+    font = subset.load_font(BytesIO(data), options)
+    subsetter = subset.Subsetter(options)
+    subsetter.populate(unicodes=codepoints)
+    subsetter.subset(font)
+    out = BytesIO()
+    subset.save_font(font, out, options)
+    return out.getvalue()
+
+
+def minify_css(css):
+    css = re.sub(r'/\*.*?\*/', '', css, flags=re.S)
+    css = re.sub(r'\s+', ' ', css)
+    css = re.sub(r'\s*([{};,>])\s*', r'\1', css)
+    css = re.sub(r':\s+', ':', css)
+    return css.replace(';}', '}').strip()
+
+
+def fingerprint(name, data):
+    stem, ext = os.path.splitext(name)
+    return f"{stem}.{hashlib.sha256(data).hexdigest()[:10]}{ext}"
+
+
+def write_dist(name, data, compress=True):
+    """يكتب الملف باسم فيه البصمة (+ .gz) ويرجع الاسم الجديد"""
+    hashed = fingerprint(name, data)
+    path = os.path.join(DIST_DIR, hashed)
+    with open(path, 'wb') as f:
+        f.write(data)
+    if compress:
+        with open(path + '.gz', 'wb') as raw, gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=9, mtime=0) as f:
+            f.write(data)
+    return hashed
+
+
+def font_faces(css, fonts):
+    """يبقي @font-face للخطوط المتاحة فقط، بملف woff2 واحد باسمه الجديد"""
+    def rewrite(match):
+        block = match.group(0)
+        for original, hashed in fonts.items():
+            if original in block:
+                return re.sub(r'src:[^;}]*', f'src:url({hashed}) format("woff2")', block)
+        return ''
+    return FONT_FACE.sub(rewrite, css)
+
+
+def cairo_blocks(css):
+    """أجزاء @font-face لخط Cairo المطلوبة فقط (عربي ولاتيني)"""
+    parts = re.findall(r'/\*\s*([a-z-]+)\s*\*/\s*(@font-face\s*\{[^}]*\})', css)
+    return '\n'.join(block for subset, block in parts if subset in CAIRO_SUBSETS)
+
+
+def build(refresh=False):
+    fetch_vendor(refresh)
+    shutil.rmtree(DIST_DIR, ignore_errors=True)
+    os.makedirs(DIST_DIR)
+
+    used = used_icon_classes()
+    fa_css, codepoints = prune_icons(read(os.path.join(VENDOR_DIR, 'fontawesome.min.css')), used)
+    fonts = {}
+    for name in ('fa-solid-900.woff2', 'fa-regular-400.woff2', 'fa-brands-400.woff2'):
+        fonts[name] = write_dist(name, subset_font(os.path.join(VENDOR_DIR, name), codepoints), compress=False)
+    fa_css = font_faces(fa_css, fonts)
+
+    cairo_css = cairo_blocks(read(os.path.join(VENDOR_DIR, 'cairo.css')))
+    cairo_fonts = {}
+    for local in sorted(set(re.findall(r'url\((cairo-\d+\.woff2)\)', cairo_css))):
+        cairo_fonts[local] = write_dist(local, read(os.path.join(VENDOR_DIR, local), 'rb'), compress=False)
+    cairo_css = font_faces(cairo_css, cairo_fonts)
+
+    # style.css كان يستورد الخط من Google Fonts - الخط الآن ضمن الملف المدمج
+    style_css = re.sub(r'@import url\([^)]*\);?', '', read(os.path.join(STATIC_DIR, 'style.css')))
+
+    bundle = '\n'.join([read(os.path.join(VENDOR_DIR, 'bootstrap.rtl.min.css')), fa_css, cairo_css, style_css])
+    manifest = {
+        'app.css': 'dist/' + write_dist('app.css', minify_css(bundle).encode('utf-8')),
+        'app.js': 'dist/' + write_dist('app.js', read(os.path.join(VENDOR_DIR, 'bootstrap.bundle.min.js'), 'rb')),
+    }
+    with open(os.path.join(DIST_DIR, 'manifest.json'), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+
+    print(f"🎯 الأيقونات المستخدمة: {len(codepoints)}")
+    for name, path in manifest.items():
+        print(f"✅ {name} -> {path} ({os.path.getsize(os.path.join(STATIC_DIR, path)) // 1024} KB)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="بناء ملفات CSS/JS/الخطوط في static/dist")
+    parser.add_argument('--refresh', action='store_true', help="إعادة تنزيل الملفات من CDN حتى لو كانت موجودة")
+    args = parser.parse_args()
+    try:
+        build(args.refresh)
+    except OSError as e:
+        print(f"❌ خطأ في بناء الملفات: {e}")
+        sys.exit(1)
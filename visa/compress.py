@@ -0,0 +1,79 @@
+"""
+ضغط gzip لاستجابات النصوص (HTML/JSON/...) مع ETag ضعيف محسوب من المحتوى قبل الضغط
+
+- الاستجابة العادية: يُحسب ETag من المحتوى، وإذا أرسل المتصفح نفس القيمة في If-None-Match
+  يرجع 304 بدون محتوى، وإلا يُضغط المحتوى إذا كان أكبر من min_size
+- الاستجابة المتدفقة (stream_with_context): تُضغط كل دفعة وتُرسل مباشرة بدون انتظار الباقي (بدون ETag)
+- الملفات (send_file) والاستجابات المضغوطة مسبقاً لا تُلمس
+
+ETag ضعيف (W/) لأن النسخة المضغوطة وغير المضغوطة نفس المحتوى بالمعنى وليس بالبايت.
+"""
+import gzip
+import hashlib
+import zlib
+
+DEFAULT_MIMETYPES = (
+    'text/html', 'text/css', 'text/plain', 'text/csv', 'text/javascript',
+    'application/javascript', 'application/json', 'image/svg+xml',
+)
+
+
+def _gzip_stream(chunks, level):
+    """يضغط دفعات المحتوى واحدة واحدة (Z_SYNC_FLUSH حتى يصل كل جزء للمتصفح فوراً)"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            if chunk:
+                yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        yield compressor.flush()
+    finally:
+        close = getattr(chunks, 'close', None)
+        if close is not None:
+            close()
+
+
+def compress_response(response, request, min_size: int = 1024, level: int = 6, mimetypes=DEFAULT_MIMETYPES):
+    if (response.direct_passthrough or response.content_encoding
+            or response.mimetype not in mimetypes or request.method not in ('GET', 'HEAD')):
+        return response
+    accepts_gzip = bool(request.accept_encodings['gzip'])
+
+    if response.is_streamed:
+        if accepts_gzip and response.status_code == 200:
+            response.response = _gzip_stream(response.response, level)
+            response.content_encoding = 'gzip'
+            response.headers.pop('Content-Length', None)
+            response.vary.add('Accept-Encoding')
+        return response
+
+    body = response.get_data()
+    if response.status_code == 200:
+        if 'ETag' not in response.headers:
+            response.set_etag(hashlib.sha1(body).hexdigest(), weak=True)
+            # صفحات المستخدم المسجل: المتصفح يحتفظ بها ويتحقق منها في كل مرة، ولا تُخزن في أي proxy
+            if not response.headers.get('Cache-Control'):
+                response.cache_control.private = True
+                response.cache_control.no_cache = True
+        response = response.make_conditional(request)
+        if response.status_code == 304:
+            return response
+    if len(body) < min_size:
+        return response
+    response.vary.add('Accept-Encoding')
+    if accepts_gzip:
+        response.set_data(gzip.compress(body, compresslevel=level, mtime=0))
+        response.content_encoding = 'gzip'
+    return response
+
+
+def init_compression(app, min_size: int = 1024, level: int = 6, mimetypes=DEFAULT_MIMETYPES, enabled: bool = True):
+    """يضيف الضغط وETag لكل استجابات التطبيق (after_request)"""
+    if not enabled:
+        return
+    from flask import request
+
+    @app.after_request
+    def _compress(response):
+        return compress_response(response, request, min_size, level, mimetypes)
@@ -0,0 +1,84 @@
+"""
+تنفيذ استعلامات القراءة المستقلة داخل نفس الطلب بالتوازي
+
+كل استعلام يعمل في thread من pool محدود داخل app context خاص به، أي session واتصال
+منفصل من connection pool. النتائج (كائنات ORM) تُربط بـ session الطلب قبل العرض حتى
+تعمل العلاقات الكسولة في القالب كالمعتاد.
+
+إذا كانت قاعدة البيانات SQLite أو الاتصالات المتاحة في الـ pool قليلة أو الـ threads
+مشغولة بطلبات أخرى، يُنفذ الاستعلام في thread الطلب نفسه (نفس النتيجة بدون توازي).
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import inspect
+from sqlalchemy.engine import Row
+from sqlalchemy.pool import QueuePool
+
+
+class ReadFanout:
+
+    def __init__(self, app, db, max_workers: int = 4, max_overflow: int = None):
+        self.app = app
+        self.db = db
+        self.max_workers = max_workers
+        # حد الاتصالات الإضافية في QueuePool كما أُعطي للـ engine (الافتراضي في SQLAlchemy هو 10)
+        if max_overflow is None:
+            max_overflow = app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}).get('max_overflow', 10)
+        self.max_overflow = max_overflow
+        self._executor = None
+        self._slots = threading.BoundedSemaphore(max_workers)
+        self._lock = threading.Lock()
+
+    def _spare_connections(self) -> int:
+        """الاتصالات التي يمكن فتحها الآن دون انتظار (مع ترك اتصال لـ thread الطلب)"""
+        engine = self.db.engine
+        if engine.dialect.name == 'sqlite':
+            return 0
+        pool = engine.pool
+        if not isinstance(pool, QueuePool) or self.max_overflow < 0:
+            return self.max_workers
+        return pool.size() + self.max_overflow - pool.checkedout() - 1
+
+    def _pool(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='read-fanout')
+            return self._executor
+
+    def _run_job(self, fn):
+        try:
+            with self.app.app_context():
+                return fn()
+        finally:
+            self._slots.release()
+
+    def _adopt(self, value):
+        """ربط كائنات ORM القادمة من session أخرى بـ session الطلب (بدون استعلام)"""
+        if isinstance(value, list):
+            return [self._adopt(v) for v in value]
+        if isinstance(value, (tuple, Row)):
+            # صفوف الأعمدة فقط (مثل payment_alert_rows) تبقى كما هي بأسماء أعمدتها
+            if not any(self._is_instance(v) for v in value):
+                return value
+            return tuple(self._adopt(v) for v in value)
+        if self._is_instance(value):
+            return self.db.session.merge(value, load=False)
+        return value
+
+    @staticmethod
+    def _is_instance(value) -> bool:
+        state = inspect(value, raiseerr=False)
+        return state is not None and getattr(state, 'mapper', None) is not None and state.key is not None
+
+    def run(self, **jobs) -> dict:
+        """ينفذ كل الدوال (بدون معاملات) ويرجع النتائج بنفس الأسماء"""
+        spare = min(self._spare_connections(), len(jobs)) if len(jobs) > 1 else 0
+        futures = {}
+        for name, fn in jobs.items():
+            if len(futures) < spare and self._slots.acquire(blocking=False):
+                futures[name] = self._pool().submit(self._run_job, fn)
+        results = {name: fn() for name, fn in jobs.items() if name not in futures}
+        for name, future in futures.items():
+            results[name] = self._adopt(future.result())
+        return {name: results[name] for name in jobs}
@@ -0,0 +1,63 @@
+"""
+كاش أجزاء القوالب (Jinja) حسب اسم الجزء + قيم يتغير بها + أرقام إصدار الجداول التي يعرضها
+
+    {% cache 'dashboard-clients', show_all on 'client', 'payment' %}
+      ... جزء ثقيل من القالب ...
+    {% endcache %}
+
+- القيم بعد الاسم (show_all) تدخل في المفتاح كما هي
+- الجداول بعد on تُقرأ أرقام إصدارها من versions(tables)، فأي تعديل في أحدها يغير المفتاح
+- التخزين في أي كائن له get/set (الافتراضي LRUCache داخل العملية)، ويُغير بـ init_fragment_cache
+"""
+from jinja2 import nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+
+from cache import LRUCache
+
+
+class FragmentCacheExtension(Extension):
+    tags = {'cache'}
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        environment.extend(
+            fragment_cache=LRUCache(maxsize=256),
+            fragment_cache_versions=lambda tables: (),
+            fragment_cache_enabled=True,
+        )
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        name = parser.parse_expression()
+        vary = []
+        while parser.stream.skip_if('comma'):
+            vary.append(parser.parse_expression())
+        tables = []
+        if parser.stream.skip_if('name:on'):
+            tables.append(parser.parse_expression())
+            while parser.stream.skip_if('comma'):
+                tables.append(parser.parse_expression())
+        body = parser.parse_statements(('name:endcache',), drop_needle=True)
+        args = [name, nodes.List(vary), nodes.List(tables)]
+        return nodes.CallBlock(self.call_method('_render', args), [], [], body).set_lineno(lineno)
+
+    def _render(self, name, vary, tables, caller):
+        env = self.environment
+        if not env.fragment_cache_enabled:
+            return caller()
+        key = ('fragment', name, tuple(repr(v) for v in vary), tuple(env.fragment_cache_versions(tuple(tables))))
+        html = env.fragment_cache.get(key)
+        if html is None:
+            html = caller()
+            env.fragment_cache.set(key, str(html))
+        return Markup(html)
+
+
+def init_fragment_cache(app, versions, backend=None, enabled: bool = True):
+    """يفعّل {% cache %} في قوالب التطبيق - versions(tables) ترجع أرقام إصدار الجداول بنفس ترتيبها"""
+    app.jinja_env.add_extension(FragmentCacheExtension)
+    app.jinja_env.fragment_cache_versions = versions
+    app.jinja_env.fragment_cache_enabled = enabled
+    if backend is not None:
+        app.jinja_env.fragment_cache = backend
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+ترقية قاعدة البيانات - يُشغل مرة واحدة مع كل نشر قبل تشغيل الـ workers
+
+- ينفذ الترقيات غير المسجلة في schema_version بالترتيب (مع قفل على Postgres)
+- ثم يزامن البيانات التي تتبع الكود: أرقام إصدار الجداول، فهرس البحث، الأوراق الافتراضية
+- ثم يحذف محتوى الملفات الذي لم تعد أي وثيقة تشير إليه (blob بعدد مراجع 0)
+
+الاستخدام:
+    python migrate.py            # تنفيذ الترقيات
+    python migrate.py --status   # عرض الترقيات المسجلة والمتبقية فقط
+"""
+import argparse
+import os
+import sys
+
+# إضافة مسار المشروع
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app import app, db, MIGRATIONS, init_db, purge_unreferenced_blobs
+from schema_migrations import current_version, pending_migrations
+
+
+def show_status():
+    with app.app_context():
+        version = current_version(db.engine)
+        print(f"📌 الإصدار الحالي: {version if version is not None else 'لا يوجد جدول schema_version'}")
+        for migration in pending_migrations(db.engine, MIGRATIONS):
+            print(f"⏳ {migration.version}: {migration.name}")
+
+
+def migrate():
+    with app.app_context():
+        try:
+            applied, documents_added = init_db()
+        except Exception as e:
+            db.session.rollback()
+            print(f"❌ خطأ في ترقية قاعدة البيانات: {e}")
+            sys.exit(1)
+        print(f"✅ ترقيات جديدة: {len(applied)} - الإصدار الحالي: {current_version(db.engine)}")
+        if documents_added:
+            print(f"✅ تمت إضافة {documents_added} ورقة للعملاء الموجودين")
+        try:
+            purged = purge_unreferenced_blobs()
+        except Exception as e:
+            db.session.rollback()
+            print(f"⚠️ خطأ في حذف الملفات غير المستخدمة: {e}")
+        else:
+            if purged:
+                print(f"🗑️ تم حذف {purged} ملف لم تعد أي وثيقة تشير إليه")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ترقية قاعدة البيانات")
+    parser.add_argument('--status', action='store_true', help="عرض الترقيات المتبقية بدون تنفيذ")
+    args = parser.parse_args()
+    if args.status:
+        show_status()
+    else:
+        migrate()
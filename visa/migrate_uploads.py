@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+نقل الملفات القديمة من UPLOAD_FOLDER إلى مخزن البصمات (blob)
+
+- يطابق كل ملف على القرص مع الوثائق التي تشير إليه في document.file_path
+- قراءة الملفات وحساب البصمة تتم بالتوازي، والكتابة في قاعدة البيانات على دفعات
+- بعد كل دفعة يُحفظ التقدم في ملف checkpoint، فإعادة التشغيل تكمل من حيث توقف
+- في النهاية يُكتب تقرير CSV بالملفات اليتيمة (بدون وثيقة) والوثائق التي لا يوجد ملفها
+
+بعد انتهاء النقل بدون أخطاء يمكن تشغيل التطبيق مع LEGACY_DISK_FALLBACK=0
+
+الاستخدام:
+    python migrate_uploads.py [--workers 4] [--batch-size 50] [--report uploads_report.csv]
+                              [--checkpoint PATH] [--restart] [--remove-files] [--dry-run]
+"""
+import argparse
+import csv
+import json
+import mimetypes
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+# إضافة مسار المشروع
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app import app, db, Document, PRIVATE_UPLOAD_DIRS, store_spooled_blob
+from blob_store import spool_stream
+
+# امتدادات الملفات القديمة المحفوظة بدون امتداد (مثل 4__1755166016) حسب أول بايتات في الملف
+MAGIC_EXTENSIONS = (
+    (b'%PDF', '.pdf'),
+    (b'\xff\xd8\xff', '.jpg'),
+    (b'\x89PNG', '.png'),
+    (b'GIF8', '.gif'),
+    (b'PK\x03\x04', '.zip'),
+)
+
+
+def walk_upload_folder(root):
+    """كل الملفات داخل UPLOAD_FOLDER بمسار نسبي (بدون مجلدات المخزن والملفات المؤقتة)"""
+    for dirpath, dirnames, filenames in os.walk(root):
+        if dirpath == root:
+            dirnames[:] = [d for d in dirnames if d not in PRIVATE_UPLOAD_DIRS]
+        for name in filenames:
+            yield os.path.relpath(os.path.join(dirpath, name), root).replace(os.sep, '/')
+
+
+def guess_extension(path):
+    with open(path, 'rb') as f:
+        head = f.read(8)
+    for magic, ext in MAGIC_EXTENSIONS:
+        if head.startswith(magic):
+            return ext
+    return ''
+
+
+def load_checkpoint(path):
+    if not os.path.exists(path):
+        return set()
+    with open(path, encoding='utf-8') as f:
+        return set(json.load(f).get('done', []))
+
+
+def save_checkpoint(path, done):
+    # كتابة ملف مؤقت ثم إعادة التسمية حتى لا يتلف الملف لو توقف السكريبت أثناء الكتابة
+    staged = path + '.part'
+    with open(staged, 'w', encoding='utf-8') as f:
+        json.dump({'done': sorted(done)}, f, ensure_ascii=False)
+    os.replace(staged, path)
+
+
+def spool_file(root, tmp_dir, rel_path):
+    """يُنفذ داخل الـ thread pool: نسخ الملف لملف مؤقت مع حساب البصمة (بدون قاعدة البيانات)"""
+    path = os.path.join(root, rel_path)
+    try:
+        with open(path, 'rb') as f:
+            blob_hash, size, tmp_path = spool_stream(f, tmp_dir)
+        return rel_path, blob_hash, size, tmp_path, guess_extension(path), None
+    except OSError as e:
+        return rel_path, None, None, None, None, str(e)
+
+
+def migrate_batch(results, docs_by_path):
+    """يربط الوثائق بمحتوى الملفات في معاملة واحدة، ويرجع المسارات التي تم نقلها"""
+    migrated = []
+    for rel_path, blob_hash, size, tmp_path, ext, error in results:
+        if error:
+            continue
+        docs = Document.query.filter(Document.id.in_(docs_by_path[rel_path])).all()
+        store_spooled_blob(blob_hash, size, tmp_path, refs=len(docs))
+        for doc in docs:
+            doc.blob_hash = blob_hash
+            doc.file_size = size
+            if not doc.file_name:
+                doc.file_name = os.path.basename(rel_path) + ('' if os.path.splitext(rel_path)[1] else ext)
+            if not doc.file_mime:
+                doc.file_mime = mimetypes.guess_type(doc.file_name)[0] or 'application/octet-stream'
+            # file_path يبقى كما هو حتى تظل الروابط القديمة (/uploads/...) تعمل من المخزن
+        migrated.append(rel_path)
+    db.session.commit()
+    return migrated
+
+
+def write_report(path, orphans, missing, failed, root):
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['status', 'path', 'size', 'document_ids', 'error'])
+        for rel_path in orphans:
+            writer.writerow(['orphan', rel_path, os.path.getsize(os.path.join(root, rel_path)), '', ''])
+        for rel_path, doc_ids in missing:
+            writer.writerow(['missing', rel_path, '', ' '.join(map(str, doc_ids)), ''])
+        for rel_path, error in failed:
+            writer.writerow(['failed', rel_path, '', '', error])
+
+
+def migrate_uploads(workers=4, batch_size=50, report='uploads_report.csv', checkpoint=None,
+                    restart=False, remove_files=False, dry_run=False):
+    with app.app_context():
+        root = app.config['UPLOAD_FOLDER']
+        tmp_dir = os.path.join(root, 'tmp')
+        os.makedirs(tmp_dir, exist_ok=True)
+        checkpoint = checkpoint or os.path.join(tmp_dir, 'migrate_uploads.json')
+        done = set() if restart else load_checkpoint(checkpoint)
+
+        print("🔄 نقل الملفات القديمة إلى مخزن البصمات...")
+        print("=" * 50)
+
+        # الوثائق التي ما زال محتواها على القرص فقط
+        docs_by_path = {}
+        for doc_id, file_path in db.session.query(Document.id, Document.file_path).filter(
+            Document.file_path.isnot(None), Document.blob_hash.is_(None), Document.file_bytes.is_(None)
+        ):
+            docs_by_path.setdefault(file_path, []).append(doc_id)
+        referenced = {p for (p,) in db.session.query(Document.file_path).filter(Document.file_path.isnot(None))}
+
+        on_disk = set(walk_upload_folder(root))
+        orphans = sorted(on_disk - referenced)
+        missing = sorted((p, ids) for p, ids in docs_by_path.items() if p not in on_disk)
+        pending = sorted(p for p in docs_by_path if p in on_disk and p not in done)
+
+        print(f"📁 ملفات على القرص: {len(on_disk)}")
+        print(f"📄 ملفات للنقل: {len(pending)} (تم سابقاً: {len(done)})")
+        print(f"👻 ملفات بدون وثيقة: {len(orphans)}")
+        print(f"❓ وثائق ملفها غير موجود: {len(missing)}")
+
+        failed = []
+        if not dry_run:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                for start in range(0, len(pending), batch_size):
+                    batch = pending[start:start + batch_size]
+                    results = list(pool.map(lambda p: spool_file(root, tmp_dir, p), batch))
+                    failed.extend((r[0], r[5]) for r in results if r[5])
+                    try:
+                        migrated = migrate_batch(results, docs_by_path)
+                    except Exception:
+                        db.session.rollback()
+                        for r in results:
+                            if r[3] and os.path.exists(r[3]):
+                                os.remove(r[3])
+                        save_checkpoint(checkpoint, done)
+                        raise
+                    done.update(migrated)
+                    save_checkpoint(checkpoint, done)
+                    if remove_files:
+                        for rel_path in migrated:
+                            os.remove(os.path.join(root, rel_path))
+                    print(f"✅ {min(start + batch_size, len(pending))}/{len(pending)}")
+
+        write_report(report, orphans, missing, failed, root)
+        print(f"\n📝 التقرير: {report}")
+        if failed:
+            print(f"❌ فشل نقل {len(failed)} ملف - أعد التشغيل بعد مراجعة التقرير")
+        elif not dry_run and not missing:
+            print("🎯 كل الملفات في المخزن الآن - يمكن تشغيل التطبيق مع LEGACY_DISK_FALLBACK=0")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="نقل الملفات القديمة من UPLOAD_FOLDER إلى مخزن البصمات")
+    parser.add_argument('--workers', type=int, default=4, help="عدد الملفات التي تُقرأ بالتوازي")
+    parser.add_argument('--batch-size', type=int, default=50, help="عدد الملفات في كل commit")
+    parser.add_argument('--report', default='uploads_report.csv', help="مسار تقرير CSV")
+    parser.add_argument('--checkpoint', help="ملف حفظ التقدم (الافتراضي UPLOAD_FOLDER/tmp/migrate_uploads.json)")
+    parser.add_argument('--restart', action='store_true', help="تجاهل التقدم المحفوظ والبدء من الأول")
+    parser.add_argument('--remove-files', action='store_true', help="حذف الملف من القرص بعد نقله")
+    parser.add_argument('--dry-run', action='store_true', help="عرض الإحصائيات والتقرير فقط بدون نقل")
+    args = parser.parse_args()
+    migrate_uploads(args.workers, args.batch_size, args.report, args.checkpoint,
+                    args.restart, args.remove_files, args.dry_run)
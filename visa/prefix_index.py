@@ -0,0 +1,103 @@
+"""
+فهرس بادئات (trie) داخل العملية للاقتراحات أثناء الكتابة
+
+كل عنصر له مفتاح وقائمة كلمات (مجهزة مسبقاً) وبيانات ترجع كما هي في النتائج.
+البحث ببداية أي كلمة لا يلمس قاعدة البيانات، والحجم محدود بعدد العقد وعمق كل كلمة.
+"""
+import threading
+from collections import deque
+
+
+class _Node:
+    __slots__ = ('children', 'keys')
+
+    def __init__(self):
+        self.children = {}
+        self.keys = set()
+
+
+class PrefixIndex:
+    """الكلمات الأطول من max_depth تُخزن عند العمق max_depth وتُفلتر بالكلمة الكاملة وقت البحث"""
+
+    def __init__(self, max_nodes: int = 200_000, max_depth: int = 12):
+        self.max_nodes = max_nodes
+        self.max_depth = max_depth
+        self._root = _Node()
+        self._nodes = 1
+        self._items = {}
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._items)
+
+    def add(self, key, tokens, payload) -> bool:
+        """يضيف العنصر أو يستبدله، ويرجع False إذا امتلأ الفهرس قبل إضافة كل كلماته"""
+        with self._lock:
+            self.remove(key)
+            tokens = tuple(dict.fromkeys(t for t in tokens if t))
+            added = []
+            for token in tokens:
+                prefix = token[:self.max_depth]
+                # أسوأ حالة: كل حروف الكلمة عقد جديدة
+                if self._nodes + len(prefix) > self.max_nodes:
+                    break
+                node = self._root
+                for ch in prefix:
+                    child = node.children.get(ch)
+                    if child is None:
+                        child = node.children[ch] = _Node()
+                        self._nodes += 1
+                    node = child
+                node.keys.add(key)
+                added.append(token)
+            self._items[key] = (tuple(added), payload)
+            return len(added) == len(tokens)
+
+    def remove(self, key):
+        with self._lock:
+            item = self._items.pop(key, None)
+            if item is None:
+                return
+            for token in item[0]:
+                path = [self._root]
+                for ch in token[:self.max_depth]:
+                    path.append(path[-1].children[ch])
+                path[-1].keys.discard(key)
+                # حذف العقد الفارغة حتى لا يكبر الفهرس مع التعديلات
+                for depth in range(len(path) - 1, 0, -1):
+                    node = path[depth]
+                    if node.keys or node.children:
+                        break
+                    del path[depth - 1].children[token[depth - 1]]
+                    self._nodes -= 1
+
+    def search(self, tokens, limit: int = 10, accept=None):
+        """العناصر التي تبدأ إحدى كلماتها بكل كلمة من tokens، الأقصر تطابقاً أولاً (accept فلتر اختياري على البيانات)"""
+        tokens = [t for t in tokens if t]
+        if not tokens:
+            return []
+        anchor = max(tokens, key=len)
+        with self._lock:
+            node = self._root
+            for ch in anchor[:self.max_depth]:
+                node = node.children.get(ch)
+                if node is None:
+                    return []
+            results = []
+            seen = set()
+            queue = deque([node])
+            while queue and len(results) < limit:
+                node = queue.popleft()
+                for key in node.keys:
+                    if key in seen:
+                        continue
+                    seen.add(key)
+                    item_tokens, payload = self._items[key]
+                    if accept is not None and not accept(payload):
+                        continue
+                    if all(any(it.startswith(t) for it in item_tokens) for t in tokens):
+                        results.append(payload)
+                        if len(results) >= limit:
+                            break
+                queue.extend(node.children.values())
+            return results
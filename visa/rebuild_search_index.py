@@ -0,0 +1,27 @@
+#!/usr/bin/env python3
+"""
+إعادة بناء فهرس البحث الموحد (search_entry) من جداول العقود ومراحل الشكاوى ودفعات الاسترداد
+
+يُستخدم بعد تعديل البيانات مباشرة في قاعدة البيانات أو بعد تغيير طريقة تجهيز نص البحث.
+"""
+import os
+import sys
+
+# إضافة مسار المشروع
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app import app, db, SearchEntry, rebuild_search_index
+
+def rebuild_all():
+    with app.app_context():
+        try:
+            rebuild_search_index()
+            db.session.commit()
+            print(f"✅ تم بناء فهرس البحث: {SearchEntry.query.count()} صف")
+        except Exception as e:
+            db.session.rollback()
+            print(f"❌ خطأ في بناء فهرس البحث: {e}")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    rebuild_all()
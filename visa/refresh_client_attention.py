@@ -0,0 +1,27 @@
+#!/usr/bin/env python3
+"""
+إعادة حساب ملخص المتابعة (client_attention) لكل العملاء
+
+يُشغّل يومياً بعد منتصف الليل: الدفعات التي أصبحت متأخرة بتغير التاريخ تنتقل إلى عدد المتأخرات.
+"""
+import os
+import sys
+
+# إضافة مسار المشروع
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app import app, db, ClientAttention, refresh_client_attention
+
+def refresh_all():
+    with app.app_context():
+        try:
+            refresh_client_attention()
+            db.session.commit()
+            print(f"✅ تم تحديث ملخص المتابعة لـ {ClientAttention.query.count()} عميل")
+        except Exception as e:
+            db.session.rollback()
+            print(f"❌ خطأ في تحديث ملخص المتابعة: {e}")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    refresh_all()
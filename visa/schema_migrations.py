@@ -0,0 +1,84 @@
+"""
+ترقيات قاعدة البيانات المرقمة مع جدول schema_version
+
+كل ترقية (رقم، اسم، دالة) تُنفذ مرة واحدة بالترتيب ويُسجل رقمها في schema_version بعد نجاحها.
+التنفيذ من migrate.py مرة واحدة مع كل نشر، وليس عند تشغيل الـ workers.
+
+على Postgres يُؤخذ advisory lock طوال التنفيذ، فإذا بدأت عمليتان معاً تنتظر الثانية
+ثم تجد الترقيات مسجلة فلا تعيدها.
+"""
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Callable, NamedTuple
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, func, select, text
+
+# رقم ثابت للقفل (أي رقم يخص هذا التطبيق)
+LOCK_KEY = 0x76697361
+
+schema_version = Table(
+    'schema_version', MetaData(),
+    Column('version', Integer, primary_key=True),
+    Column('name', String(200), nullable=False),
+    Column('applied_at', DateTime, nullable=False),
+)
+
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    run: Callable[[], None]
+
+
+@contextmanager
+def migration_lock(engine, key: int = LOCK_KEY):
+    if engine.dialect.name != 'postgresql':
+        # SQLite للتشغيل المحلي - عملية واحدة
+        yield
+        return
+    with engine.connect() as conn:
+        conn.execute(text("SELECT pg_advisory_lock(:key)"), {'key': key})
+        conn.commit()
+        try:
+            yield
+        finally:
+            conn.execute(text("SELECT pg_advisory_unlock(:key)"), {'key': key})
+            conn.commit()
+
+
+def current_version(engine):
+    """آخر ترقية مسجلة، أو None إذا لم يوجد جدول schema_version بعد (استعلام واحد)"""
+    try:
+        with engine.connect() as conn:
+            return conn.execute(select(func.coalesce(func.max(schema_version.c.version), 0))).scalar()
+    except Exception:
+        return None
+
+
+def pending_migrations(engine, migrations):
+    version = current_version(engine) or 0
+    return [m for m in sorted(migrations) if m.version > version]
+
+
+def run_migrations(db, migrations) -> list:
+    """ينفذ الترقيات غير المسجلة بالترتيب (كل ترقية ثم تسجيلها في commit واحد) ويرجع ما نُفذ"""
+    versions = [m.version for m in migrations]
+    if len(set(versions)) != len(versions):
+        raise ValueError("أرقام ترقيات مكررة")
+    engine = db.engine
+    applied = []
+    with migration_lock(engine):
+        schema_version.create(engine, checkfirst=True)
+        for migration in pending_migrations(engine, migrations):
+            print(f"🔄 ترقية {migration.version}: {migration.name}")
+            try:
+                migration.run()
+                db.session.execute(schema_version.insert().values(
+                    version=migration.version, name=migration.name, applied_at=datetime.utcnow()
+                ))
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+            applied.append(migration)
+    return applied
@@ -0,0 +1,93 @@
+"""
+تجهيز النص المخزن في فهرس البحث (search_entry.search_text)
+
+نفس التجهيز يُطبق على نص الاستعلام حتى تتطابق الكتابة المختلفة لنفس القيمة:
+"أحمد" و"احمد" و"أَحْمَد"، "فاطمة" و"فاطمه"، "مصطفى" و"مصطفي"، "٠١٠" و"010".
+"""
+
+# توحيد الحروف: أشكال الألف، التاء المربوطة، الألف المقصورة، والأرقام العربية/الفارسية
+ARABIC_FOLDING = str.maketrans({
+    'أ': 'ا', 'إ': 'ا', 'آ': 'ا', 'ٱ': 'ا',
+    'ة': 'ه',
+    'ى': 'ي',
+    **{chr(0x0660 + i): str(i) for i in range(10)},
+    **{chr(0x06F0 + i): str(i) for i in range(10)},
+})
+
+# التشكيل (فتحة، ضمة، كسرة، تنوين، شدة، سكون، مدة/همزة منفصلة، ألف خنجرية) والتطويل - تُحذف
+ARABIC_REMOVED = dict.fromkeys([*range(0x064B, 0x0656), 0x0670, 0x0640])
+
+
+def normalize_text(value) -> str:
+    """حروف صغيرة، حروف عربية موحدة بدون تشكيل، ومسافة واحدة بين الكلمات"""
+    text = str(value or '').lower().translate(ARABIC_REMOVED).translate(ARABIC_FOLDING)
+    return ' '.join(text.split())
+
+
+def build_search_text(name, phone) -> str:
+    """النص المفهرس لصف واحد: الاسم ثم الهاتف"""
+    return normalize_text(f"{name or ''} {phone or ''}")
+
+
+def normalize_query(value) -> str:
+    return normalize_text(value)
+
+
+# أقل عدد أرقام يُعامل كجزء من رقم هاتف (آخر الأرقام)، وأقل عدد لرقم كامل
+PHONE_SUFFIX_MIN_DIGITS = 6
+PHONE_FULL_MIN_DIGITS = 10
+
+
+def phone_digits(value) -> str:
+    return ''.join(ch for ch in normalize_text(value) if ch.isdigit())
+
+
+def canonical_phone(value):
+    """الأرقام فقط بدون كود مصر (+20 / 0020) وبدون الصفر في البداية: 01012345678 -> 1012345678"""
+    digits = phone_digits(value)
+    if digits.startswith('00'):
+        digits = digits[2:]
+    if digits.startswith('20') and len(digits) >= 12:
+        digits = digits[2:]
+    return digits.lstrip('0') or None
+
+
+def reversed_phone(value):
+    """الرقم الموحد معكوساً - البحث بآخر الأرقام يصبح بحثاً ببداية النص في الفهرس"""
+    canonical = canonical_phone(value)
+    return canonical[::-1] if canonical else None
+
+
+def phone_query(value):
+    """
+    ('full', الرقم الموحد) لرقم كامل، أو ('partial', (آخر الأرقام معكوسة، بداية الرقم الموحد))
+    لجزء من رقم قد يكون بدايته أو نهايته - وإلا None إذا لم يكن الاستعلام رقم هاتف
+    """
+    text = normalize_text(value)
+    digits = phone_digits(text)
+    if len(digits) < PHONE_SUFFIX_MIN_DIGITS or any(not (ch.isdigit() or ch in ' +-()') for ch in text):
+        return None
+    if len(digits) >= PHONE_FULL_MIN_DIGITS:
+        return 'full', canonical_phone(digits)
+    # كنهاية رقم: الأصفار في بداية الجزء أرقام حقيقية، وكبداية رقم: يُحذف صفر الرقم المحلي
+    return 'partial', (digits[::-1], phone_prefix(text))
+
+
+def phone_prefix(value, min_digits: int = 3):
+    """بداية رقم هاتف أثناء كتابته بالصيغة الموحدة (بدون +20/0020 والصفر)، أو None إذا لم يكن رقماً"""
+    text = normalize_text(value)
+    digits = phone_digits(text)
+    if len(digits) < min_digits or any(not (ch.isdigit() or ch in ' +-()') for ch in text):
+        return None
+    if text.startswith('+') or digits.startswith('00'):
+        digits = digits.lstrip('0')
+        digits = digits[2:] if digits.startswith('20') else digits
+    return digits.lstrip('0') or None
+
+
+def digits_prefix_bound(prefix: str):
+    """أصغر نص أرقام أكبر من كل النصوص التي تبدأ بـ prefix (None إذا لم يوجد) - لبحث بالمدى [prefix, bound)"""
+    stripped = prefix.rstrip('9')
+    if not stripped:
+        return None
+    return stripped[:-1] + str(int(stripped[-1]) + 1)
@@ -0,0 +1,86 @@
+"""
+إعداد الاختبارات: قاعدة SQLite ومجلد رفع مؤقتان يُحددان قبل استيراد app
+(لا اتصال بقاعدة البيانات الحقيقية ولا ترجمة مسبقة للقوالب)
+
+التشغيل من مجلد visa:
+    python -m pytest
+"""
+import io
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+TMP_DIR = tempfile.mkdtemp(prefix='visa-tests-')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(TMP_DIR, 'test.db')
+os.environ['UPLOAD_FOLDER'] = os.path.join(TMP_DIR, 'uploads')
+os.environ['TEMPLATE_WARMUP'] = '0'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as visa_app  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def app():
+    with visa_app.app.app_context():
+        visa_app.init_db()
+    yield visa_app.app
+    shutil.rmtree(TMP_DIR, ignore_errors=True)
+
+
+@pytest.fixture
+def db(app):
+    """db داخل app context - التعديلات غير المحفوظة تُلغى بعد الاختبار"""
+    with app.app_context():
+        yield visa_app.db
+        visa_app.db.session.rollback()
+
+
+@pytest.fixture
+def client(app):
+    """test client بمستخدم مسجل الدخول"""
+    test_client = app.test_client()
+    with test_client.session_transaction() as session:
+        session['user_id'] = 1
+        session['employee_name'] = 'اختبار'
+    return test_client
+
+
+@pytest.fixture
+def rendered(app):
+    """قيم القوالب المعروضة أثناء الاختبار: [(اسم القالب، القيم)]"""
+    from flask import template_rendered
+
+    records = []
+
+    def record(sender, template, context, **extra):
+        records.append((template.name, context))
+
+    template_rendered.connect(record, app)
+    yield records
+    template_rendered.disconnect(record, app)
+
+
+
+@pytest.fixture
+def contract(client):
+    """عميل جديد بأوراقه الافتراضية (كما يضيفه المستخدم) - يرجع (رقم العميل، أرقام الوثائق)"""
+    from app import Document
+
+    response = client.post('/contracts/new', data={'name': 'عميل اختبار', 'phone': '01012345678',
+                                                    'visa_type': 'سياحة', 'total_amount': '1000'})
+    client_id = int(response.headers['Location'].rstrip('/').rsplit('/', 1)[-1])
+    with client.application.app_context():
+        doc_ids = [d.id for d in Document.query.filter_by(client_id=client_id).order_by(Document.id)]
+    return client_id, doc_ids
+
+
+@pytest.fixture
+def upload(client):
+    """رفع ملف لوثيقة من نموذج صفحة العميل"""
+    def post(client_id, doc_id, data, filename='scan.pdf'):
+        return client.post(f'/client/{client_id}/upload_document/{doc_id}',
+                           data={'file': (io.BytesIO(data), filename)}, content_type='multipart/form-data')
+    return post
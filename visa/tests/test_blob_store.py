@@ -0,0 +1,87 @@
+import hashlib
+import io
+import os
+
+import pytest
+
+from blob_store import CHUNK_SIZE, BlobTooLarge, LocalBlobBackend, spool_stream
+
+
+def test_spool_stream_hashes_while_copying(tmp_path):
+    data = os.urandom(CHUNK_SIZE * 2 + 17)
+    blob_hash, size, path = spool_stream(io.BytesIO(data), str(tmp_path), chunk_size=4096)
+    assert (blob_hash, size) == (hashlib.sha256(data).hexdigest(), len(data))
+    with open(path, 'rb') as f:
+        assert f.read() == data
+
+
+def test_spool_stream_rejects_large_files_and_removes_the_temp_file(tmp_path):
+    with pytest.raises(BlobTooLarge):
+        spool_stream(io.BytesIO(b'x' * 100), str(tmp_path), max_size=99, chunk_size=10)
+    assert os.listdir(tmp_path) == []
+
+
+def test_local_backend_write_open_delete(tmp_path):
+    from app import Blob
+
+    backend = LocalBlobBackend(str(tmp_path / 'blobs'))
+    data = b'local blob'
+    blob_hash, size, path = spool_stream(io.BytesIO(data), str(tmp_path / 'tmp'))
+    blob = Blob(hash=blob_hash, size=size, backend=backend.name)
+    backend.write_file(blob, path)
+    assert not os.path.exists(path)
+    with backend.open(blob) as f:
+        assert f.read() == data
+    backend.delete(blob_hash)
+    assert not os.path.exists(backend.path_for(blob_hash))
+
+
+def test_database_reader_reads_across_chunks(db):
+    from app import BLOB_BACKENDS, Blob, BlobChunk, purge_unreferenced_blobs, store_blob
+
+    data = os.urandom(CHUNK_SIZE * 2 + 1000)
+    blob = store_blob(io.BytesIO(data))
+    db.session.commit()
+    assert blob.backend == 'db'
+    assert BlobChunk.query.filter_by(blob_hash=blob.hash).count() == 3
+    # قراءة raw ترجع حتى نهاية الجزء الحالي فقط - BufferedReader يكمل من الجزء التالي
+    with io.BufferedReader(BLOB_BACKENDS['db'].open(blob)) as reader:
+        assert reader.read() == data
+        reader.seek(CHUNK_SIZE - 10)
+        assert reader.read(20) == data[CHUNK_SIZE - 10:CHUNK_SIZE + 10]
+        reader.seek(-5, io.SEEK_END)
+        assert reader.read() == data[-5:]
+    blob_hash = blob.hash
+    blob.ref_count = 0
+    db.session.commit()
+    assert purge_unreferenced_blobs() >= 1
+    assert db.session.get(Blob, blob_hash) is None
+    assert BlobChunk.query.filter_by(blob_hash=blob_hash).count() == 0
+
+
+def test_same_content_is_stored_once_and_purged_after_last_reference(client, db, contract, upload):
+    from app import Blob, BlobChunk, Document, purge_unreferenced_blobs
+
+    client_id, doc_ids = contract
+    data = b'%PDF-1.4\n' + os.urandom(5000)
+    blob_hash = hashlib.sha256(data).hexdigest()
+    for doc_id in doc_ids[:2]:
+        assert upload(client_id, doc_id, data).status_code == 302
+
+    db.session.expire_all()
+    assert db.session.get(Blob, blob_hash).ref_count == 2
+    assert {d.blob_hash for d in Document.query.filter(Document.id.in_(doc_ids[:2]))} == {blob_hash}
+
+    client.post(f'/client/{client_id}/delete_document/{doc_ids[0]}')
+    db.session.expire_all()
+    assert db.session.get(Blob, blob_hash).ref_count == 1
+    purge_unreferenced_blobs()
+    assert db.session.get(Blob, blob_hash) is not None
+
+    # استبدال ملف الوثيقة الثانية يترك المحتوى القديم بدون مراجع
+    assert upload(client_id, doc_ids[1], b'%PDF-1.4\nnew').status_code == 302
+    db.session.expire_all()
+    assert db.session.get(Blob, blob_hash).ref_count == 0
+    assert purge_unreferenced_blobs() >= 1
+    assert db.session.get(Blob, blob_hash) is None
+    assert BlobChunk.query.filter_by(blob_hash=blob_hash).count() == 0
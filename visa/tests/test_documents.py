@@ -0,0 +1,124 @@
+import hashlib
+import io
+import os
+import zipfile
+
+import pytest
+
+from zipstream import stream_zip
+
+PDF = b'%PDF-1.4\n' + bytes(range(256)) * 40
+
+
+@pytest.fixture
+def uploaded(contract, upload):
+    client_id, doc_ids = contract
+    assert upload(client_id, doc_ids[0], PDF, 'passport.pdf').status_code == 302
+    return client_id, doc_ids[0]
+
+
+def test_view_sends_strong_etag_from_content_hash(client, uploaded):
+    _, doc_id = uploaded
+    response = client.get(f'/document/{doc_id}/view')
+    assert response.status_code == 200
+    assert response.data == PDF
+    assert response.get_etag() == (hashlib.sha256(PDF).hexdigest(), False)
+    assert response.headers['Accept-Ranges'] == 'bytes'
+    assert response.content_length == len(PDF)
+    assert 'private' in response.headers['Cache-Control']
+
+
+def test_matching_etag_returns_304(client, uploaded):
+    _, doc_id = uploaded
+    etag = client.get(f'/document/{doc_id}/view').headers['ETag']
+    response = client.get(f'/document/{doc_id}/download', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.data == b''
+
+
+@pytest.mark.parametrize('header, start, end', [
+    ('bytes=0-99', 0, 99),
+    ('bytes=5000-', 5000, len(PDF) - 1),
+    ('bytes=-10', len(PDF) - 10, len(PDF) - 1),
+])
+def test_range_returns_partial_content(client, uploaded, header, start, end):
+    _, doc_id = uploaded
+    response = client.get(f'/document/{doc_id}/view', headers={'Range': header})
+    assert response.status_code == 206
+    assert response.headers['Content-Range'] == f'bytes {start}-{end}/{len(PDF)}'
+    assert response.data == PDF[start:end + 1]
+
+
+def test_range_past_the_end_is_rejected(client, uploaded):
+    _, doc_id = uploaded
+    response = client.get(f'/document/{doc_id}/view', headers={'Range': f'bytes={len(PDF) + 10}-'})
+    assert response.status_code == 416
+
+
+def test_legacy_filename_route_follows_document_changes(client, db, contract):
+    from app import Document
+
+    _, doc_ids = contract
+    doc = db.session.get(Document, doc_ids[1])
+    doc.file_path, doc.file_name, doc.file_bytes = 'legacy/old-scan.pdf', 'old-scan.pdf', b'%PDF-1.4 first'
+    db.session.commit()
+    assert client.get('/uploads/legacy/old-scan.pdf').data == b'%PDF-1.4 first'
+
+    # الكاش مرتبط بإصدار جدول document: التعديل يظهر في الطلب التالي
+    doc.file_bytes = b'%PDF-1.4 second'
+    db.session.commit()
+    response = client.get('/download_pdf/legacy/old-scan.pdf')
+    assert response.data == b'%PDF-1.4 second'
+    assert 'attachment' in response.headers['Content-Disposition']
+
+    assert client.get('/uploads/legacy/missing.pdf').status_code == 404
+
+
+def test_legacy_disk_fallback_hides_private_dirs(client, app):
+    folder = app.config['UPLOAD_FOLDER']
+    with open(os.path.join(folder, 'on-disk.pdf'), 'wb') as f:
+        f.write(b'%PDF-1.4 disk')
+    assert client.get('/uploads/on-disk.pdf').data == b'%PDF-1.4 disk'
+    os.makedirs(os.path.join(folder, 'tmp'), exist_ok=True)
+    with open(os.path.join(folder, 'tmp', 'secret.pdf'), 'wb') as f:
+        f.write(b'secret')
+    assert client.get('/uploads/tmp/secret.pdf').status_code == 404
+    assert client.get('/uploads/../app.py').status_code == 404
+
+
+def test_download_all_documents_streams_a_valid_zip(client, contract, upload):
+    client_id, doc_ids = contract
+    image = os.urandom(3000)
+    upload(client_id, doc_ids[0], PDF, 'passport.pdf')
+    upload(client_id, doc_ids[1], image, 'photo.jpg')
+    upload(client_id, doc_ids[2], PDF, 'passport.pdf')
+
+    response = client.get(f'/client/{client_id}/download_all_documents')
+    assert response.status_code == 200
+    assert response.is_streamed
+    with zipfile.ZipFile(io.BytesIO(response.data)) as zf:
+        assert zf.testzip() is None
+        files = {info.filename: zf.read(info) for info in zf.infolist()}
+        assert all(info.compress_type == zipfile.ZIP_STORED for info in zf.infolist())
+    assert sorted(files.values()) == sorted([PDF, image, PDF])
+    assert len(files) == 3
+
+
+def test_stream_zip_skips_files_that_cannot_be_opened():
+    def missing():
+        raise FileNotFoundError('gone')
+
+    text = b'hello ' * 1000
+    chunks = list(stream_zip([
+        ('a.txt', lambda: io.BytesIO(text)),
+        ('gone.pdf', missing),
+        ('deleted.pdf', lambda: None),
+        ('b.pdf', lambda: io.BytesIO(PDF)),
+    ], chunk_size=1024))
+    assert len(chunks) > 2
+    with zipfile.ZipFile(io.BytesIO(b''.join(chunks))) as zf:
+        assert zf.testzip() is None
+        assert zf.namelist() == ['a.txt', 'b.pdf']
+        assert zf.getinfo('a.txt').compress_type == zipfile.ZIP_DEFLATED
+        assert zf.getinfo('b.pdf').compress_type == zipfile.ZIP_STORED
+        assert zf.read('a.txt') == text and zf.read('b.pdf') == PDF
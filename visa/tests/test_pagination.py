@@ -0,0 +1,84 @@
+from datetime import date, datetime
+
+import pytest
+
+from app import DisappointedClient, decode_cursor, encode_cursor, keyset_paginate
+
+
+@pytest.fixture
+def rows(db):
+    """7 صفوف بأوقات متساوية وصفين بدون created_at - مرتبة كما تعرضها الصفحات (الأحدث أولاً)"""
+    times = [datetime(2024, 5, 3), datetime(2024, 5, 2), datetime(2024, 5, 2), datetime(2024, 5, 2),
+             datetime(2024, 5, 1), None, None]
+    clients = [DisappointedClient(client_name=f'صفحات {i}', phone='0100', contract_date=date(2024, 1, 1),
+                                  paid_amount=1, client_complaint='pagination-test', created_at=t or datetime.utcnow())
+               for i, t in enumerate(times)]
+    db.session.add_all(clients)
+    db.session.flush()
+    missing = [c.id for c, t in zip(clients, times) if t is None]
+    db.session.execute(db.update(DisappointedClient).where(DisappointedClient.id.in_(missing)).values(created_at=None))
+    db.session.commit()
+    # الوقت الأحدث أولاً، والأوقات المتساوية بالأكبر id، ثم الصفوف بدون وقت
+    yield [clients[i].id for i in (0, 3, 2, 1, 4, 6, 5)]
+    DisappointedClient.query.filter_by(client_complaint='pagination-test').delete()
+    db.session.commit()
+
+
+def page(app, **args):
+    with app.test_request_context('/', query_string=args):
+        query = DisappointedClient.query.filter_by(client_complaint='pagination-test')
+        return keyset_paginate(query, DisappointedClient)
+
+
+def test_cursor_round_trip():
+    row = DisappointedClient(id=42, created_at=datetime(2024, 5, 2, 13, 45, 10, 123456))
+    assert decode_cursor(encode_cursor(row)) == (row.created_at, 42)
+    assert decode_cursor(encode_cursor(DisappointedClient(id=7, created_at=None))) == (None, 7)
+    assert decode_cursor('') is None
+    assert decode_cursor('not-a-cursor') is None
+
+
+def test_next_cursors_walk_every_row_once(app, rows):
+    seen, cursor, pages = [], None, 0
+    while True:
+        current = page(app, per_page=2, **({'after': cursor} if cursor else {}))
+        pages += 1
+        assert (current.prev_cursor is None) == (cursor is None)
+        seen += [c.id for c in current.items]
+        cursor = current.next_cursor
+        if cursor is None:
+            break
+    assert seen == rows
+    assert pages == 4
+
+
+def test_prev_cursor_returns_the_same_page(app, rows):
+    first = page(app, per_page=3)
+    second = page(app, per_page=3, after=first.next_cursor)
+    third = page(app, per_page=3, after=second.next_cursor)
+    assert [c.id for c in third.items] == rows[6:]
+    assert third.next_cursor is None
+
+    back = page(app, per_page=3, before=third.prev_cursor)
+    assert [c.id for c in back.items] == [c.id for c in second.items] == rows[3:6]
+    assert back.next_cursor == second.next_cursor
+    start = page(app, per_page=3, before=back.prev_cursor)
+    assert [c.id for c in start.items] == rows[:3]
+    assert start.prev_cursor is None
+
+
+def test_page_boundary_exactly_full(app, rows):
+    # 7 صفوف بصفحة من 7: لا صفحة تالية فارغة
+    current = page(app, per_page=7)
+    assert [c.id for c in current.items] == rows
+    assert current.next_cursor is None
+
+
+def test_per_page_is_clamped(app, rows):
+    app.config['MAX_PAGE_SIZE'], limit = 5, app.config['MAX_PAGE_SIZE']
+    try:
+        assert page(app, per_page=1000).per_page == 5
+        assert page(app, per_page=0).per_page == min(app.config['PAGE_SIZE'], 5)
+        assert page(app, per_page=-3).per_page == 1
+    finally:
+        app.config['MAX_PAGE_SIZE'] = limit
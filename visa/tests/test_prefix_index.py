@@ -0,0 +1,113 @@
+from prefix_index import PrefixIndex
+
+
+def names(results):
+    return sorted(r['name'] for r in results)
+
+
+def make_index(**kwargs):
+    index = PrefixIndex(**kwargs)
+    for key, name in enumerate(['احمد علي', 'احمد سامي', 'امل حسن', 'سامي فوزي']):
+        index.add(key, name.split(), {'name': name})
+    return index
+
+
+def test_search_by_prefix_of_any_word():
+    index = make_index()
+    assert names(index.search(['احم'])) == ['احمد سامي', 'احمد علي']
+    assert names(index.search(['سام'])) == ['احمد سامي', 'سامي فوزي']
+    assert index.search(['خالد']) == []
+    assert index.search(['']) == []
+
+
+def test_all_query_words_must_match():
+    index = make_index()
+    assert names(index.search(['احمد', 'سا'])) == ['احمد سامي']
+
+
+def test_limit_and_accept():
+    index = make_index()
+    assert len(index.search(['ا'], limit=2)) == 2
+    assert names(index.search(['ا'], accept=lambda p: 'حسن' in p['name'])) == ['امل حسن']
+
+
+def test_words_longer_than_max_depth_are_filtered_by_full_word():
+    index = PrefixIndex(max_depth=3)
+    index.add(1, ['abcdef'], {'name': 'abcdef'})
+    index.add(2, ['abcxyz'], {'name': 'abcxyz'})
+    assert names(index.search(['abc'])) == ['abcdef', 'abcxyz']
+    assert names(index.search(['abcd'])) == ['abcdef']
+    assert index.search(['abcdz']) == []
+
+
+def test_max_nodes_stops_adding_words():
+    index = PrefixIndex(max_nodes=6)
+    assert index.add(1, ['abc'], {'name': 'abc'}) is True
+    # ينقص عقدتان فقط: الكلمة الثانية لا تُضاف
+    assert index.add(2, ['ab', 'xyz'], {'name': 'ab xyz'}) is False
+    assert index._nodes <= 6
+    assert names(index.search(['ab'])) == ['ab xyz', 'abc']
+    assert index.search(['xy']) == []
+
+
+def test_remove_and_replace_free_nodes():
+    index = make_index()
+    assert len(index) == 4
+    index.add(0, ['خالد'], {'name': 'خالد'})
+    assert names(index.search(['احمد'])) == ['احمد سامي']
+    assert names(index.search(['خال'])) == ['خالد']
+    for key in range(4):
+        index.remove(key)
+    index.remove(99)
+    assert len(index) == 0
+    assert index._nodes == 1
+    assert index.search(['خ']) == []
+
+
+def test_refresh_applies_search_changes(db):
+    from app import Client, SuggestState, build_suggest_index, refresh_suggest_index
+
+    def suggested(prefix):
+        return [r['id'] for r in SuggestState.index.search([prefix]) if r['entity'] == 'client']
+
+    build_suggest_index()
+    client = Client(name='نادر الشريف', phone='01234567890', visa_type='سياحة', total_amount=100)
+    db.session.add(client)
+    db.session.commit()
+    assert client.id not in suggested('نادر')
+
+    refresh_suggest_index()
+    assert client.id in suggested('نادر')
+    assert client.id in suggested('1234567')
+
+    client.name = 'ماهر الشريف'
+    db.session.commit()
+    refresh_suggest_index()
+    assert client.id not in suggested('نادر')
+    assert client.id in suggested('ماهر')
+
+    db.session.delete(client)
+    db.session.commit()
+    refresh_suggest_index()
+    assert client.id not in suggested('ماهر')
+
+
+def test_full_rebuild_prunes_old_changes(db):
+    from app import Client, SearchChange, SuggestState, SUGGEST_CHANGE_OVERLAP, build_suggest_index
+
+    build_suggest_index()
+    clients = [Client(name=f'سجل {i}', phone=f'0111000{i:04d}', visa_type='سياحة', total_amount=1)
+               for i in range(SUGGEST_CHANGE_OVERLAP + 5)]
+    db.session.add_all(clients)
+    db.session.commit()
+    first_build = SuggestState.built_change
+
+    build_suggest_index(prune_log=True)
+    oldest = db.session.query(db.func.min(SearchChange.id)).scalar()
+    assert oldest is None or oldest > first_build - SUGGEST_CHANGE_OVERLAP
+    assert SuggestState.built_change == db.session.query(db.func.max(SearchChange.id)).scalar()
+    assert all(c.id in [r['id'] for r in SuggestState.index.search(['سجل'], limit=100)] for c in clients)
+
+    for c in clients:
+        db.session.delete(c)
+    db.session.commit()
@@ -0,0 +1,59 @@
+from datetime import date
+
+from app import ClientFollowup, DisappointedClient, LegalCase
+
+
+def add_disappointed(db, name, phone):
+    client = DisappointedClient(client_name=name, phone=phone, contract_date=date(2024, 1, 1),
+                                paid_amount=100, client_complaint='شكوى')
+    db.session.add(client)
+    db.session.flush()
+    return client
+
+
+def add_followup(db, client_id=None):
+    followup = ClientFollowup(client_id=client_id, form_received_date=date(2024, 2, 1),
+                              client_call_date=date(2024, 2, 2), call_details='مكالمة',
+                              client_complaint='شكوى', new_agreement='اتفاق')
+    db.session.add(followup)
+    db.session.flush()
+    return followup
+
+
+def search_results(client, rendered, **params):
+    response = client.get('/search_client', query_string=params)
+    assert response.status_code == 200
+    name, context = rendered[-1]
+    assert name == 'disappointed_clients.html'
+    return context['search_results']
+
+
+def test_search_client_loads_followups_and_cases_of_matched_client(db, client, rendered):
+    matched = add_disappointed(db, 'سامية عبد الرحمن', '01099887766')
+    other = add_disappointed(db, 'منير فهمي', '01211223344')
+    followup = add_followup(db, matched.id)
+    add_followup(db, other.id)
+    add_followup(db)
+    case = LegalCase(followup_id=followup.id, form_received_date=date(2024, 3, 1),
+                     call_date=date(2024, 3, 2), call_details='تفاصيل', last_agreement='اتفاق')
+    db.session.add(case)
+    db.session.commit()
+
+    results = search_results(client, rendered, client_name='سامية عبد')
+
+    assert results['file_management'].id == matched.id
+    assert [f.id for f in results['followups']] == [followup.id]
+    assert [c.id for c in results['legal_cases']] == [case.id]
+
+
+def test_search_client_without_file_client_has_no_followups(db, client, rendered):
+    # لا يوجد بحث منفصل في المتابعات: المتابعة المرتبطة تظهر فقط مع عميلها،
+    # وغير المرتبطة لا اسم لها يطابق البحث (كان البحث القديم بـ outer join يرجعها فارغة أيضاً)
+    add_followup(db)
+    db.session.commit()
+
+    results = search_results(client, rendered, client_name='اسم غير موجود إطلاقا')
+
+    assert results['file_management'] is None
+    assert results['followups'] == []
+    assert results['legal_cases'] == []
@@ -0,0 +1,67 @@
+from datetime import date
+
+import pytest
+
+from search_text import (build_search_text, canonical_phone, digits_prefix_bound, normalize_text,
+                         phone_prefix, phone_query, reversed_phone)
+
+
+@pytest.mark.parametrize('written, expected', [
+    ('أحمد', 'احمد'),
+    ('إسلام', 'اسلام'),
+    ('آمال', 'امال'),
+    ('فاطمة', 'فاطمه'),
+    ('مصطفى', 'مصطفي'),
+    ('أَحْمَد', 'احمد'),
+    ('مـحـمـد', 'محمد'),
+    ('  Ahmed   ALI ', 'ahmed ali'),
+    ('٠١٠۱۲', '01012'),
+])
+def test_normalize_text_folds_spelling_variants(written, expected):
+    assert normalize_text(written) == expected
+
+
+def test_variants_share_one_search_text():
+    assert build_search_text('فاطمة أحمد', '٠١٠١٢٣٤٥٦٧٨') == build_search_text('فاطمه احمد', '01012345678')
+    assert build_search_text(None, None) == ''
+
+
+@pytest.mark.parametrize('phone', ['01012345678', '+201012345678', '00201012345678', '٠١٠١٢٣٤٥٦٧٨', '010 1234-5678'])
+def test_canonical_phone_drops_country_code_and_leading_zero(phone):
+    assert canonical_phone(phone) == '1012345678'
+    assert reversed_phone(phone) == '8765432101'
+
+
+def test_phone_query_kinds():
+    assert phone_query('01012345678') == ('full', '1012345678')
+    # جزء من رقم: آخر الأرقام معكوسة + بداية الرقم بدون صفر الرقم المحلي
+    assert phone_query('0101234') == ('partial', ('4321010', '101234'))
+    assert phone_query('12345') is None
+    assert phone_query('أحمد 0101234') is None
+
+
+def test_phone_prefix_and_bound():
+    assert phone_prefix('010') == '10'
+    assert phone_prefix('+2010') == '10'
+    assert phone_prefix('01') is None
+    assert digits_prefix_bound('10') == '11'
+    assert digits_prefix_bound('1099') == '11'
+    assert digits_prefix_bound('99') is None
+
+
+@pytest.mark.parametrize('query', ['فاطمه الزهراء', 'فاطمة الزهراء', 'فاطمة الزهرا', 'فاطِمة'])
+def test_search_index_matches_spelling_variants(db, query):
+    from app import DisappointedClient, search_index
+
+    client = DisappointedClient(client_name='فاطِمة الزَهراء', phone='٠١١٥٥٥٦٦٦٧٧', contract_date=date(2024, 1, 1),
+                                paid_amount=1, client_complaint='x')
+    db.session.add(client)
+    db.session.commit()
+    try:
+        hits = search_index(query, entities=['disappointed'])
+        assert client.id in [h.entity_id for h in hits]
+        phone_hits = search_index('01155566677', entities=['disappointed'])
+        assert client.id in [h.entity_id for h in phone_hits]
+    finally:
+        db.session.delete(client)
+        db.session.commit()
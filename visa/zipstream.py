@@ -0,0 +1,79 @@
+"""
+كتابة ملف ZIP كاستجابة متدفقة
+
+كل جزء يُرسل للمتصفح فور كتابته بدلاً من بناء الأرشيف كاملاً في الذاكرة،
+فالذاكرة المستخدمة ثابتة مهما كان عدد الملفات أو حجمها.
+"""
+import os
+import time
+import zipfile
+
+from blob_store import CHUNK_SIZE
+
+# صيغ مضغوطة أصلاً - إعادة ضغطها تستهلك المعالج بدون أي توفير في الحجم
+STORED_EXTENSIONS = {
+    '.pdf', '.jpg', '.jpeg', '.png', '.gif', '.webp',
+    '.zip', '.rar', '.7z', '.gz',
+    '.docx', '.xlsx', '.pptx',
+}
+
+
+class _StreamSink:
+    """هدف كتابة غير قابل للـ seek: يجمع ما يكتبه zipfile حتى يُسحب ويُرسل"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def compress_type_for(arcname: str) -> int:
+    ext = os.path.splitext(arcname)[1].lower()
+    return zipfile.ZIP_STORED if ext in STORED_EXTENSIONS else zipfile.ZIP_DEFLATED
+
+
+def stream_zip(entries, chunk_size: int = CHUNK_SIZE):
+    """
+    يولّد محتوى ملف ZIP على أجزاء.
+    entries: أزواج (الاسم داخل الأرشيف، دالة بدون معاملات تفتح الملف للقراءة).
+    الملف الذي لا يمكن فتحه (الدالة ترجع None أو OSError) يُتخطى حتى يكتمل الأرشيف،
+    لأن رؤوس الاستجابة تكون قد أُرسلت بالفعل.
+    """
+    sink = _StreamSink()
+    date_time = time.localtime()[:6]
+    with zipfile.ZipFile(sink, 'w') as zf:
+        for arcname, opener in entries:
+            try:
+                src = opener()
+            except OSError as e:
+                print(f"⚠️ تعذر فتح {arcname} أثناء إنشاء الأرشيف: {e}")
+                continue
+            if src is None:
+                print(f"⚠️ الملف {arcname} لم يعد موجوداً - تم تخطيه في الأرشيف")
+                continue
+            zinfo = zipfile.ZipInfo(arcname, date_time=date_time)
+            zinfo.compress_type = compress_type_for(arcname)
+            with src, zf.open(zinfo, 'w') as dst:
+                while True:
+                    chunk = src.read(chunk_size)
+                    if not chunk:
+                        break
+                    dst.write(chunk)
+                    data = sink.drain()
+                    if data:
+                        yield data
+            data = sink.drain()
+            if data:
+                yield data
+    # الفهرس المركزي يُكتب عند إغلاق الأرشيف
+    yield sink.drain()